@@ -0,0 +1,154 @@
+import math
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+import hashing
+
+# Login attempts allowed per account, from every address together: a burst, then rate more per second. A rate of 0 switches the limit off.
+# The burst is generous so someone failing logins against an account cannot easily lock its owner out.
+ACCOUNT_RATE = float(os.environ.get("GEVS_ADMISSION_ACCOUNT_RATE", 0.1))
+ACCOUNT_BURST = float(os.environ.get("GEVS_ADMISSION_ACCOUNT_BURST", 20))
+# Login, registration and commissioner requests allowed per client address, in the same way
+CLIENT_RATE = float(os.environ.get("GEVS_ADMISSION_CLIENT_RATE", 5))
+CLIENT_BURST = float(os.environ.get("GEVS_ADMISSION_CLIENT_BURST", 50))
+# Most requests that hash or verify a password allowed in progress at once, across every route.
+# Defaults to what the hashing pool can take, which also bounds hashing on request threads when GEVS_HASH_WORKERS is 0.
+EXPENSIVE_LIMIT = int(os.environ.get("GEVS_ADMISSION_EXPENSIVE_LIMIT", max(hashing.WORKERS, 1) * hashing.QUEUE_DEPTH_PER_WORKER))
+# Most accounts or addresses tracked, the least recently seen making room for new ones
+MAX_TRACKED = int(os.environ.get("GEVS_ADMISSION_MAX_TRACKED", 100000))
+
+# Addresses allowed to pass on the real client address in X-Forwarded-For, i.e. the frontend
+TRUSTED_PROXIES = {address.strip() for address in os.environ.get("GEVS_TRUSTED_PROXIES", "127.0.0.1,::1").split(",") if address.strip()}
+
+class Shed(Exception):
+    """
+    Raised when a request is turned away before doing any expensive work.
+    status is 429 when the caller is over its rate and 503 when the server is at capacity.
+    """
+
+    def __init__(self, status, message, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.payload = {"status": "failed", "message": message, "retry_after": self.retry_after}
+
+class TokenBuckets:
+    """
+    A token bucket per key, holding up to burst tokens and refilled at rate tokens per second.
+    Buckets are stored as (tokens, last update) and only brought up to date when taken from.
+    """
+
+    def __init__(self, rate, burst, max_size=MAX_TRACKED):
+        self.rate = rate
+        self.burst = burst
+        self.max_size = max_size
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key):
+        """
+        Take a token from key's bucket.
+        Returns 0 if there was one, otherwise the seconds until there will be.
+        """
+
+        if self.rate <= 0 or key is None:
+            return 0
+
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / self.rate
+
+            while self._buckets and len(self._buckets) >= self.max_size:
+                del self._buckets[next(iter(self._buckets))]
+            self._buckets[key] = (tokens, now)
+
+        return wait
+
+    def __len__(self):
+        return len(self._buckets)
+
+class AdmissionControl:
+    """
+    Turns requests away early, before they reach the database or the hashing pool, when
+    the account or client is over its rate or the server already has EXPENSIVE_LIMIT password hashes in progress.
+    Every rejection is counted by route and reason for /gevs/metrics.
+    """
+
+    def __init__(self):
+        self.accounts = TokenBuckets(ACCOUNT_RATE, ACCOUNT_BURST)
+        self.clients = TokenBuckets(CLIENT_RATE, CLIENT_BURST)
+        self.expensive_limit = EXPENSIVE_LIMIT
+        self.in_progress = 0
+        self._rejected = Counter()
+        self._lock = threading.Lock()
+
+    def reject(self, route, reason):
+        with self._lock:
+            self._rejected[(route, reason)] += 1
+
+    def admit(self, route, client=None, account=None):
+        """
+        Take a token for the client address and then the account.
+        Raises Shed with a 429 if either has run out.
+        """
+
+        wait = self.clients.take(client)
+        if wait:
+            self.reject(route, "client_rate")
+            raise Shed(429, "Too many requests, please try again later", wait)
+
+        wait = self.accounts.take(account)
+        if wait:
+            self.reject(route, "account_rate")
+            raise Shed(429, "Too many attempts for this account, please try again later", wait)
+
+    @contextmanager
+    def expensive(self, route):
+        """
+        Hold one of the EXPENSIVE_LIMIT slots for password hashing while the block runs.
+        Raises Shed with a 503 if they are all taken, rather than queueing behind them.
+        """
+
+        with self._lock:
+            if self.expensive_limit > 0 and self.in_progress >= self.expensive_limit:
+                self._rejected[(route, "capacity")] += 1
+                raise Shed(503, "Server busy, please try again", 1)
+            self.in_progress += 1
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_progress -= 1
+
+    def stats(self):
+        """
+        Return a dictionary of rejections keyed by (route, reason), plus the current state of each limit.
+        """
+
+        with self._lock:
+            return {
+                "rejected": dict(self._rejected),
+                "in_progress": self.in_progress,
+                "accounts": len(self.accounts),
+                "clients": len(self.clients)
+            }
+
+def client_address(remote_address, forwarded_for=None):
+    """
+    The address to rate limit a request by: the last X-Forwarded-For entry when the request came through a trusted proxy,
+    otherwise the address that connected.
+    """
+
+    if forwarded_for and remote_address in TRUSTED_PROXIES:
+        return forwarded_for.split(",")[-1].strip() or remote_address
+    return remote_address
@@ -1,50 +1,136 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import cross_origin
+from werkzeug.http import is_resource_modified
+from datetime import datetime, timezone
 import database
-import argon2
-from argon2.exceptions import VerifyMismatchError
+import os
+import queue
+import time
+import codecs
+import json
+import cache
+import stream
+import hashing
+import bulk_import
+import audit_export
+import metrics
+import profiler
+import admission
 
 app = Flask(__name__)
 
-# Setup db init stuff
+# Every Database method records its latency, rows and errors for /gevs/metrics
+metrics.instrument(database.Database)
+
+# Rendered results responses, keyed by the results version they were built for
+results_cache = cache.ResponseCache(max_size=256)
+
+# Shared source of live tally pushes for every event stream
+tally_publisher = stream.TallyPublisher()
+SSE_KEEPALIVE_SECONDS = 15
+
+# Rate limits and the cap on concurrent password hashing, shared by every route
+admission_control = admission.AdmissionControl()
+
+# Setup db init stuff. Migrations are skipped once the schema is current, and the UVC load
+# carries on from wherever an earlier run stopped, picking up codes appended to the file since.
 with database.Database() as db:
-    db._create_tables()
+    db.migrate()
     db._populate_uvc_codes()
-    db._populate_other_tables()
 
-@app.route("/gevs/login", methods=["POST"])
-def login():
-    data = request.get_json()
-    request_email = data.get("email")
-    request_password = data.get("password")
+# Returned when password hashing is saturated, asking the client to come back shortly.
+# Shaped like admission control's 503, so clients handle both the same way.
+BUSY = ({"status": "failed", "message": "Server busy, please try again", "retry_after": 1}, 503)
+
+def json_response(payload, status):
+    response = jsonify(payload)
+    response.status_code = status
+    if status in (429, 503):
+        response.headers["Retry-After"] = str(payload.get("retry_after", 1))
+    return response
+
+def busy_response():
+    return json_response(*BUSY)
+
+def is_commissioner(email, password, client=None):
+    """
+    Check credentials against the commissioner account.
+    Raises hashing.HashingBusy if the password cannot be checked right now,
+    or admission.Shed if the client is over its rate or too many passwords are being checked already.
+    """
+
+    if not email or not password:
+        return False
+
+    admission_control.admit("commissioner", client)
 
-    # Check commissioner login
     with database.Database() as db:
-        saved_password = db.get_commissioner_login(request_email)
+        account = db.get_account(email)
 
-    if saved_password and request_password:
-        try:
-            argon2.verify_password(saved_password, request_password.encode())
-            return jsonify({"status": "success", "account": "commissioner"})
-        except VerifyMismatchError:
-            pass
+    if not account or account[0] != "commissioner":
+        return False
+
+    with admission_control.expensive("commissioner"):
+        verified, _ = hashing.verify_password(account[1], password)
+    return verified
 
-    # Check voter login
+def request_client():
+    return admission.client_address(request.remote_addr, request.headers.get("X-Forwarded-For"))
+
+def commissioner_authorized():
+    """
+    Check the request's HTTP Basic credentials against the commissioner account.
+    """
+
+    auth = request.authorization
+    return bool(auth) and is_commissioner(auth.username, auth.password, request_client())
+
+def unauthorized_response():
+    response = jsonify({"status": "failed", "message": "Commissioner credentials required"})
+    response.status_code = 401
+    response.headers["WWW-Authenticate"] = 'Basic realm="GEVS"'
+    return response
+
+# The handlers below return (payload, status) and are also called directly by api_client's in-process backend
+
+def login_account(email, password, client=None):
+    # Shed floods from one address, then repeated attempts at one account from anywhere, before any query
+    try:
+        admission_control.admit("login", client, account=email)
+    except admission.Shed as shed:
+        return shed.payload, shed.status
+
+    # Find out whether this is a commissioner or voter before doing any hashing
     with database.Database() as db:
-        saved_password = db.get_login(request_email)
+        account = db.get_account(email)
 
-    if saved_password and request_password:
-        try:
-            argon2.verify_password(saved_password, request_password.encode())
-            return jsonify({"status": "success", "account": "voter"})
-        except VerifyMismatchError:
-            return jsonify({"status": "failed"}), 401
-    else:
-        return jsonify({"status": "failed"}), 400
+    if not account:
+        return {"status": "failed"}, 400
 
-@app.route("/gevs/register", methods=["POST"])
-def register():
-    data = request.get_json()
+    if not password:
+        return {"status": "failed"}, 400
+
+    account_type, saved_password = account
+
+    try:
+        with admission_control.expensive("login"):
+            verified, new_hash = hashing.verify_password(saved_password, password)
+    except hashing.HashingBusy:
+        return BUSY
+    except admission.Shed as shed:
+        return shed.payload, shed.status
+
+    if not verified:
+        return {"status": "failed"}, 401
+
+    # Hash was made with old argon2 parameters, swap in the rehashed one
+    if new_hash:
+        with database.Database() as db:
+            db.update_password(account_type, email, new_hash)
+
+    return {"status": "success", "account": account_type}, 200
+
+def register_account(data, client=None):
     email = data.get("email")
     password = data.get("password")
     full_name = data.get("full_name")
@@ -52,61 +138,326 @@ def register():
     uvc = data.get("uvc")
     constituency_id = data.get("constituency_id")
 
-    hashed_password = argon2.hash_password(password.encode())
+    try:
+        admission_control.admit("register", client)
+    except admission.Shed as shed:
+        return shed.payload, shed.status
 
+    # Reject bad requests with one query before spending time on hashing
     with database.Database() as db:
-        if db.is_email_registered(email):
-            return jsonify({"status": "failed", "message": "Email already registered"}), 400
+        rejection = db.check_registration(email, uvc)
 
-        if not db.is_uvc_valid(uvc):
-            return jsonify({"status": "failed", "message": "Invalid or already used UVC"}), 400
+    if rejection:
+        return {"status": "failed", "message": rejection}, 400
 
-        voter_id = db.register_voter(email, full_name, dob, hashed_password, uvc, constituency_id)
+    try:
+        with admission_control.expensive("register"):
+            hashed_password = hashing.hash_password(password)
+    except hashing.HashingBusy:
+        return BUSY
+    except admission.Shed as shed:
+        return shed.payload, shed.status
 
-    if voter_id:
-        return jsonify({"status": "success", "voter_id": voter_id})
+    # The claim is checked again atomically, someone may have taken the email or UVC while we were hashing
+    try:
+        with database.Database() as db:
+            rejection = db.claim_registration(email, full_name, dob, hashed_password, uvc, constituency_id)
+    except database.RegistrationFailed:
+        return {"status": "failed", "message": "Registration failed"}, 500
+
+    if rejection is None:
+        return {"status": "success", "voter_id": email}, 200
     else:
-        return jsonify({"status": "failed", "message": "Registration failed"}), 500
+        return {"status": "failed", "message": rejection}, 400
 
-@app.route("/gevs/constituency/<constituency_name>", methods=["GET"])
-@cross_origin(origin='http://127.0.0.1:5000', headers=['Content-Type', 'Authorization'])
-def get_constituency_results(constituency_name):
-    with database.Database() as db:
-        results = db.get_constituency_results(constituency_name)
+def constituency_results(db, constituency_name):
+    # Once the election has concluded the frozen snapshot is the record
+    snapshot = db.get_results_snapshot()
+    if snapshot:
+        constituencies = json.loads(snapshot[0])["constituencies"]
+        results = next((constituency["results"] for constituency in constituencies if constituency["constituency"] == constituency_name), None)
+        if results:
+            return {"constituency": constituency_name, "results": results}, 200
+        return {"status": "failed", "message": "Failed to fetch constituency results"}, 500
+
+    results = db.get_constituency_results(constituency_name)
 
     if results:
-        return jsonify({
+        return {
             "constituency": constituency_name,
             "results": [{"candidate": result[0], "party": result[1], "vote_count": result[2]} for result in results]
+        }, 200
+    else:
+        return {"status": "failed", "message": "Failed to fetch constituency results"}, 500
+
+def election_results(db):
+    response_data = database.national_result(db.get_seats_by_party())
+
+    if response_data:
+        return response_data, 200
+    else:
+        return {"status": "Ongoing"}, 200
+
+def request_route():
+    # Label by route pattern rather than path so constituency names don't each get their own series
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+    # Reading the profiler's output shouldn't show up in it
+    if request.endpoint not in ("profile", "profile_output"):
+        profiler.profiler.enter(f"{request.method} {request_route()}")
+
+@app.after_request
+def record_request(response):
+    started = g.get("request_started")
+    if started is not None:
+        metrics.record_request(request_route(), request.method, response.status_code, time.perf_counter() - started)
+    return response
+
+@app.teardown_request
+def stop_sampling(exception=None):
+    profiler.profiler.exit()
+
+@app.errorhandler(admission.Shed)
+def shed_response(shed):
+    return json_response(shed.payload, shed.status)
+
+@app.route("/gevs/metrics", methods=["GET"])
+def get_metrics():
+    return Response(metrics.render(results_cache, admission_control), mimetype="text/plain; version=0.0.4")
+
+@app.route("/gevs/profile", methods=["GET", "POST", "DELETE"])
+def profile():
+    """
+    Commissioner-only control of the sampling profiler.
+    POST starts a window, taking optional JSON "seconds", "sample_rate" and "interval";
+    DELETE ends it early and GET reports its state and samples per route.
+    """
+
+    try:
+        if not commissioner_authorized():
+            return unauthorized_response()
+    except hashing.HashingBusy:
+        return busy_response()
+
+    if request.method == "POST":
+        data = request.get_json(silent=True) or {}
+        try:
+            profiler.profiler.start(
+                float(data.get("seconds", 30)),
+                float(data.get("sample_rate", 1.0)),
+                float(data.get("interval", profiler.SAMPLE_INTERVAL))
+            )
+        except (TypeError, ValueError):
+            return json_response({"status": "failed", "message": "seconds, sample_rate and interval must be numbers"}, 400)
+    elif request.method == "DELETE":
+        profiler.profiler.stop()
+
+    return json_response(profiler.profiler.status(), 200)
+
+@app.route("/gevs/profile/<output_format>", methods=["GET"])
+def profile_output(output_format):
+    """
+    Samples from the last profiling window, optionally for one ?route= (e.g. "POST /gevs/login").
+    "collapsed" gives flamegraph input, "pstats" a file for python -m pstats and "text" a printed pstats report.
+    """
+
+    try:
+        if not commissioner_authorized():
+            return unauthorized_response()
+    except hashing.HashingBusy:
+        return busy_response()
+
+    route = request.args.get("route")
+    if output_format == "collapsed":
+        return Response(profiler.profiler.collapsed(route), mimetype="text/plain")
+    elif output_format == "pstats":
+        return Response(profiler.profiler.pstats_dump(route), mimetype="application/octet-stream", headers={
+            "Content-Disposition": 'attachment; filename="gevs.pstats"'
         })
+    elif output_format == "text":
+        sort = request.args.get("sort", "cumulative")
+        if sort not in ("cumulative", "tottime", "calls"):
+            return json_response({"status": "failed", "message": "sort must be cumulative, tottime or calls"}, 400)
+        return Response(profiler.profiler.pstats_text(route, sort), mimetype="text/plain")
     else:
-        return jsonify({"status": "failed", "message": "Failed to fetch constituency results"}), 500
+        return json_response({"status": "failed", "message": "Unknown profile format"}, 404)
+
+@app.route("/gevs/login", methods=["POST"])
+def login():
+    data = request.get_json()
+    return json_response(*login_account(data.get("email"), data.get("password"), request_client()))
+
+@app.route("/gevs/register", methods=["POST"])
+def register():
+    return json_response(*register_account(request.get_json(), request_client()))
+
+@app.route("/gevs/voters/import", methods=["POST"])
+def import_voters():
+    """
+    Bulk register voters from a JSONL (default) or CSV (Content-Type: text/csv) request body.
+    The body is read and the per-row error report written back as JSONL a chunk at a time.
+    """
+
+    try:
+        if not commissioner_authorized():
+            return unauthorized_response()
+    except hashing.HashingBusy:
+        return busy_response()
+
+    file_format = "csv" if request.mimetype == "text/csv" else "jsonl"
+    rows = bulk_import.read_rows(codecs.iterdecode(request.stream, "utf-8"), file_format)
+
+    def generate():
+        for entry in bulk_import.import_voters(rows):
+            yield json.dumps(entry) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+AUDIT_MIMETYPES = {"csv": "text/csv", "jsonl": "application/x-ndjson", "columnar": "application/octet-stream"}
+
+@app.route("/gevs/audit/export", methods=["GET"])
+def export_audit():
+    """
+    Stream every ballot and tally for audit as ?format=csv, jsonl or columnar, with ?pii=hash (default) or strip.
+    Rows go out a batch at a time as they are read, so memory stays flat however large the electorate.
+    """
+
+    try:
+        if not commissioner_authorized():
+            return unauthorized_response()
+    except hashing.HashingBusy:
+        return busy_response()
+
+    file_format = request.args.get("format", "csv")
+    pii = request.args.get("pii", "hash")
+    if file_format not in audit_export.FORMATS or pii not in ("hash", "strip"):
+        return json_response({"status": "failed", "message": "format must be csv, jsonl or columnar and pii hash or strip"}, 400)
+
+    chunks = audit_export.render(audit_export.export_records(pii=pii), file_format)
+    extension = "bin" if file_format == "columnar" else file_format
+    return Response(stream_with_context(chunks), mimetype=AUDIT_MIMETYPES[file_format], headers={
+        "Content-Disposition": f'attachment; filename="gevs-audit.{extension}"'
+    })
+
+def cached_results(key, build):
+    """
+    Serve a results response through results_cache, keyed by the current results version.
+    Conditional requests for an unchanged version get a 304 without building anything.
+    build(db) returns a normal view response; only successful ones are cached.
+    """
 
-@app.route("/gevs/results", methods=["GET"])
-def get_election_results():
     with database.Database() as db:
-        seat_results = db.get_seats_by_party()
-
-    if seat_results:
-        max_seat_count = max(result["seat"] for result in seat_results)
-        winning_party = next((result["party"] for result in seat_results if result["seat"] == max_seat_count), "")
-        
-        # Check if thers a tie
-        if list(result["seat"] for result in seat_results).count(max_seat_count) > 1:
-            winner = "Hung Parliament"
+        version, updated_at = db.get_results_version()
+
+        etag = f"results-{version}"
+        last_modified = datetime.fromtimestamp(updated_at, timezone.utc)
+
+        if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+            response = Response(status=304)
         else:
-            winner = winning_party
-        
-        seats_formatted = [{"party": result["party"], "seat": result["seat"]} for result in seat_results]
-
-        response_data = {
-            "status": "Completed",
-            "winner": winner,
-            "seats": seats_formatted
-        }
-        return jsonify(response_data)
+            body = results_cache.get((key, version))
+            if body is None:
+                built = app.make_response(build(db))
+                if built.status_code != 200:
+                    return built
+
+                body = built.get_data()
+                results_cache.put((key, version), body)
+
+            response = Response(body, mimetype="application/json")
+
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    return response
+
+@app.route("/gevs/constituency/<constituency_name>", methods=["GET"])
+@cross_origin(origin='http://127.0.0.1:5000', headers=['Content-Type', 'Authorization'])
+def get_constituency_results(constituency_name):
+    return cached_results(("constituency", constituency_name), lambda db: constituency_results(db, constituency_name))
+
+def event_stream(subscriber):
+    """
+    Turn a tally subscriber into a Server-Sent Events response.
+    """
+
+    def generate():
+        try:
+            while not subscriber.closed:
+                try:
+                    event = subscriber.events.get(timeout=SSE_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                if event is None:
+                    break
+                yield event
+        finally:
+            tally_publisher.unsubscribe(subscriber)
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+@app.route("/gevs/constituency/<constituency_name>/stream", methods=["GET"])
+@cross_origin(origin='http://127.0.0.1:5000', headers=['Content-Type', 'Authorization'])
+def stream_constituency_results(constituency_name):
+    if not tally_publisher.has_constituency(constituency_name):
+        return jsonify({"status": "failed", "message": "Unknown constituency"}), 404
+
+    return event_stream(tally_publisher.subscribe(constituency_name))
+
+@app.route("/gevs/constituencies/stream", methods=["GET"])
+@cross_origin(origin='http://127.0.0.1:5000', headers=['Content-Type', 'Authorization'])
+def stream_all_constituency_results():
+    return event_stream(tally_publisher.subscribe())
+
+def snapshot_response(snapshot, download=False):
+    """
+    Serve the frozen results bytes as stored, tagged with their checksum.
+    """
+
+    body, checksum, created_at = snapshot
+    etag = f"snapshot-{checksum}"
+    last_modified = datetime.fromtimestamp(created_at, timezone.utc)
+
+    if not download and not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = Response(status=304)
     else:
-        return jsonify({"status": "Ongoing"}), 200
+        response = Response(body, mimetype="application/json")
+
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.headers["X-Checksum-SHA256"] = checksum
+    if download:
+        response.headers["Content-Disposition"] = f'attachment; filename="gevs-results-{checksum[:12]}.json"'
+    return response
+
+@app.route("/gevs/results", methods=["GET"])
+def get_election_results():
+    with database.Database() as db:
+        snapshot = db.get_results_snapshot()
+
+    if snapshot:
+        return snapshot_response(snapshot)
+    return cached_results(("results",), election_results)
+
+@app.route("/gevs/results/snapshot", methods=["GET"])
+def export_election_results():
+    """
+    Download the results frozen when the election concluded, for publication.
+    """
+
+    with database.Database() as db:
+        snapshot = db.get_results_snapshot()
+
+    if not snapshot:
+        return json_response({"status": "failed", "message": "The election has not concluded"}, 404)
+    return snapshot_response(snapshot, download=True)
 
 if __name__ == "__main__":
-    app.run(debug=True, port=5001)
+    app.run(debug=os.environ.get("GEVS_DEBUG", "1") == "1", port=int(os.environ.get("GEVS_API_PORT", 5001)))
@@ -0,0 +1,511 @@
+import asyncio
+import contextvars
+import io
+import json
+import os
+import re
+import tempfile
+import time
+from base64 import b64decode
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from urllib.parse import parse_qs
+import api
+import database
+import hashing
+import stream
+import bulk_import
+import audit_export
+import metrics
+import profiler
+import admission
+
+# ASGI entry point serving the same /gevs/* routes as api.py on an asyncio event loop.
+# Run it with any ASGI server from this directory, e.g. "uvicorn asgi:app --port 5001".
+
+# Blocking work is handed to these, sized to what the connection pool and hashing pool can serve at once
+DB_EXECUTOR = ThreadPoolExecutor(max_workers=database.POOL_SIZE, thread_name_prefix="gevs-db")
+HASH_EXECUTOR = ThreadPoolExecutor(max_workers=max(hashing.WORKERS, 1) * hashing.QUEUE_DEPTH_PER_WORKER, thread_name_prefix="gevs-hash")
+
+# Most requests each route may have in progress, and how long a request waits for a slot before a 503
+ROUTE_LIMITS = {
+    "login": int(os.environ.get("GEVS_ASGI_LOGIN_LIMIT", 64)),
+    "register": int(os.environ.get("GEVS_ASGI_REGISTER_LIMIT", 32)),
+    "import": int(os.environ.get("GEVS_ASGI_IMPORT_LIMIT", 1)),
+    "audit": int(os.environ.get("GEVS_ASGI_AUDIT_LIMIT", 1)),
+    "constituency": int(os.environ.get("GEVS_ASGI_RESULTS_LIMIT", 256)),
+    "results": int(os.environ.get("GEVS_ASGI_RESULTS_LIMIT", 256)),
+    "stream": int(os.environ.get("GEVS_ASGI_STREAM_LIMIT", 10000)),
+    "metrics": int(os.environ.get("GEVS_ASGI_METRICS_LIMIT", 4)),
+    "profile": int(os.environ.get("GEVS_ASGI_PROFILE_LIMIT", 4))
+}
+ROUTE_QUEUE_TIMEOUT = float(os.environ.get("GEVS_ASGI_QUEUE_TIMEOUT", 1))
+MAX_JSON_BODY = 1024 * 1024
+CORS_ORIGIN = "http://127.0.0.1:5000"
+
+_route_slots = {route: asyncio.Semaphore(limit) for route, limit in ROUTE_LIMITS.items()}
+
+# Profiler label of the request being handled, when the sampling profiler picked it.
+# The event loop thread is shared by every request, so it is the executor threads doing the work that get sampled.
+_sampled_route = contextvars.ContextVar("gevs_sampled_route", default=None)
+
+class Request:
+    def __init__(self, scope, receive):
+        self.scope = scope
+        self.receive = receive
+        self.headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+
+    async def body_chunks(self):
+        while True:
+            message = await self.receive()
+            if message["type"] == "http.disconnect":
+                return
+
+            yield message.get("body", b"")
+            if not message.get("more_body"):
+                return
+
+    async def json(self):
+        """
+        Return the JSON body, or None if it is missing, too large or not an object.
+        """
+
+        body = b""
+        async for chunk in self.body_chunks():
+            body += chunk
+            if len(body) > MAX_JSON_BODY:
+                return None
+
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+
+    def query(self, name, default=None):
+        values = parse_qs(self.scope.get("query_string", b"").decode("latin-1")).get(name)
+        return values[0] if values else default
+
+    def client(self):
+        """
+        Return the address to rate limit this request by, see admission.client_address.
+        """
+
+        client = self.scope.get("client")
+        return admission.client_address(client[0] if client else None, self.headers.get("x-forwarded-for"))
+
+    def basic_auth(self):
+        """
+        Return the (username, password) of HTTP Basic credentials, or (None, None).
+        """
+
+        scheme, _, credentials = self.headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "basic":
+            return None, None
+
+        try:
+            username, _, password = b64decode(credentials).decode().partition(":")
+        except ValueError:
+            return None, None
+        return username, password
+
+def _encode_headers(headers):
+    return [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+
+async def send_response(send, status, body=b"", headers=(), content_type="application/json"):
+    headers = [("Content-Type", content_type), ("Content-Length", str(len(body)))] + list(headers)
+    await send({"type": "http.response.start", "status": status, "headers": _encode_headers(headers)})
+    await send({"type": "http.response.body", "body": body})
+
+async def send_json(send, payload, status, headers=()):
+    headers = list(headers)
+    if status in (429, 503):
+        headers.append(("Retry-After", str(payload.get("retry_after", 1))))
+    await send_response(send, status, json.dumps(payload).encode(), headers)
+
+def _run_sampled(route, function, *args):
+    profiler.profiler.attach(route)
+    try:
+        return function(*args)
+    finally:
+        profiler.profiler.exit()
+
+async def run(executor, function, *args):
+    route = _sampled_route.get()
+    if route is not None:
+        return await asyncio.get_running_loop().run_in_executor(executor, _run_sampled, route, function, *args)
+    return await asyncio.get_running_loop().run_in_executor(executor, function, *args)
+
+async def commissioner_authorized(request, send):
+    """
+    Check the request's HTTP Basic credentials are the commissioner's.
+    If not, sends the 401 or 503 response and returns False.
+    """
+
+    try:
+        authorized = await run(HASH_EXECUTOR, api.is_commissioner, *request.basic_auth(), request.client())
+    except hashing.HashingBusy:
+        await send_json(send, *api.BUSY)
+        return False
+
+    if not authorized:
+        await send_json(send, {"status": "failed", "message": "Commissioner credentials required"}, 401, [("WWW-Authenticate", 'Basic realm="GEVS"')])
+    return authorized
+
+def _results_version():
+    with database.Database() as db:
+        return db.get_results_version()
+
+def _build_results(build):
+    with database.Database() as db:
+        return build(db)
+
+def _not_modified(request, etag, last_modified):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+
+    return False
+
+async def cached_results(request, send, key, build, headers=()):
+    """
+    Async counterpart of api.cached_results, sharing its results_cache.
+    """
+
+    version, updated_at = await run(DB_EXECUTOR, _results_version)
+    etag = f'"results-{version}"'
+    last_modified = datetime.fromtimestamp(updated_at, timezone.utc)
+    headers = list(headers) + [("ETag", etag), ("Last-Modified", format_datetime(last_modified, usegmt=True))]
+
+    if _not_modified(request, etag, last_modified):
+        await send({"type": "http.response.start", "status": 304, "headers": _encode_headers(headers)})
+        await send({"type": "http.response.body", "body": b""})
+        return
+
+    body = api.results_cache.get((key, version))
+    if body is None:
+        payload, status = await run(DB_EXECUTOR, _build_results, build)
+        if status != 200:
+            await send_json(send, payload, status)
+            return
+
+        body = json.dumps(payload).encode()
+        api.results_cache.put((key, version), body)
+
+    await send_response(send, 200, body, headers)
+
+async def login(request, send):
+    data = await request.json()
+    if data is None:
+        await send_json(send, {"status": "failed"}, 400)
+        return
+
+    await send_json(send, *await run(HASH_EXECUTOR, api.login_account, data.get("email"), data.get("password"), request.client()))
+
+async def register(request, send):
+    data = await request.json()
+    if data is None:
+        await send_json(send, {"status": "failed", "message": "Registration failed"}, 400)
+        return
+
+    await send_json(send, *await run(HASH_EXECUTOR, api.register_account, data, request.client()))
+
+async def import_voters(request, send):
+    if not await commissioner_authorized(request, send):
+        return
+
+    file_format = "csv" if request.headers.get("content-type", "").startswith("text/csv") else "jsonl"
+
+    # Spool the roll to disk so memory stays flat, then report back a row at a time
+    with tempfile.TemporaryFile() as body:
+        async for chunk in request.body_chunks():
+            body.write(chunk)
+        body.seek(0)
+
+        lines = io.TextIOWrapper(body, encoding="utf-8", newline="")
+        report = bulk_import.import_voters(bulk_import.read_rows(lines, file_format))
+
+        await send({"type": "http.response.start", "status": 200, "headers": _encode_headers([("Content-Type", "application/x-ndjson")])})
+        while True:
+            entry = await run(DB_EXECUTOR, next, report, None)
+            if entry is None:
+                break
+            await send({"type": "http.response.body", "body": (json.dumps(entry) + "\n").encode(), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+async def export_audit(request, send):
+    if not await commissioner_authorized(request, send):
+        return
+
+    file_format = request.query("format", "csv")
+    pii = request.query("pii", "hash")
+    if file_format not in audit_export.FORMATS or pii not in ("hash", "strip"):
+        await send_json(send, {"status": "failed", "message": "format must be csv, jsonl or columnar and pii hash or strip"}, 400)
+        return
+
+    chunks = audit_export.render(audit_export.export_records(pii=pii), file_format)
+    extension = "bin" if file_format == "columnar" else file_format
+    await send({"type": "http.response.start", "status": 200, "headers": _encode_headers([
+        ("Content-Type", api.AUDIT_MIMETYPES[file_format]),
+        ("Content-Disposition", f'attachment; filename="gevs-audit.{extension}"')
+    ])})
+    try:
+        while True:
+            chunk = await run(DB_EXECUTOR, next, chunks, None)
+            if chunk is None:
+                break
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        await run(DB_EXECUTOR, chunks.close)
+
+async def constituency_results(request, send, constituency_name):
+    await cached_results(request, send, ("constituency", constituency_name), lambda db: api.constituency_results(db, constituency_name), [("Access-Control-Allow-Origin", CORS_ORIGIN)])
+
+def _results_snapshot():
+    with database.Database() as db:
+        return db.get_results_snapshot()
+
+async def send_snapshot(request, send, snapshot, download=False):
+    """
+    Async counterpart of api.snapshot_response.
+    """
+
+    body, checksum, created_at = snapshot
+    etag = f'"snapshot-{checksum}"'
+    last_modified = datetime.fromtimestamp(created_at, timezone.utc)
+    headers = [("ETag", etag), ("Last-Modified", format_datetime(last_modified, usegmt=True)), ("X-Checksum-SHA256", checksum)]
+
+    if download:
+        headers.append(("Content-Disposition", f'attachment; filename="gevs-results-{checksum[:12]}.json"'))
+    elif _not_modified(request, etag, last_modified):
+        await send({"type": "http.response.start", "status": 304, "headers": _encode_headers(headers)})
+        await send({"type": "http.response.body", "body": b""})
+        return
+
+    await send_response(send, 200, body, headers)
+
+async def election_results(request, send):
+    snapshot = await run(DB_EXECUTOR, _results_snapshot)
+    if snapshot:
+        await send_snapshot(request, send, snapshot)
+        return
+    await cached_results(request, send, ("results",), api.election_results)
+
+async def export_election_results(request, send):
+    snapshot = await run(DB_EXECUTOR, _results_snapshot)
+    if not snapshot:
+        await send_json(send, {"status": "failed", "message": "The election has not concluded"}, 404)
+        return
+    await send_snapshot(request, send, snapshot, download=True)
+
+async def profile(request, send):
+    """
+    Async counterpart of api.profile.
+    """
+
+    if not await commissioner_authorized(request, send):
+        return
+
+    if request.scope["method"] == "POST":
+        data = await request.json() or {}
+        try:
+            settings = (
+                float(data.get("seconds", 30)),
+                float(data.get("sample_rate", 1.0)),
+                float(data.get("interval", profiler.SAMPLE_INTERVAL))
+            )
+        except (TypeError, ValueError):
+            await send_json(send, {"status": "failed", "message": "seconds, sample_rate and interval must be numbers"}, 400)
+            return
+        await run(DB_EXECUTOR, profiler.profiler.start, *settings)
+    elif request.scope["method"] == "DELETE":
+        await run(DB_EXECUTOR, profiler.profiler.stop)
+
+    await send_json(send, profiler.profiler.status(), 200)
+
+async def profile_output(request, send, output_format):
+    """
+    Async counterpart of api.profile_output.
+    """
+
+    if not await commissioner_authorized(request, send):
+        return
+
+    route = request.query("route")
+    if output_format == "collapsed":
+        body = await run(DB_EXECUTOR, profiler.profiler.collapsed, route)
+        await send_response(send, 200, body.encode(), content_type="text/plain")
+    elif output_format == "pstats":
+        body = await run(DB_EXECUTOR, profiler.profiler.pstats_dump, route)
+        await send_response(send, 200, body, [("Content-Disposition", 'attachment; filename="gevs.pstats"')], "application/octet-stream")
+    elif output_format == "text":
+        sort = request.query("sort", "cumulative")
+        if sort not in ("cumulative", "tottime", "calls"):
+            await send_json(send, {"status": "failed", "message": "sort must be cumulative, tottime or calls"}, 400)
+            return
+        body = await run(DB_EXECUTOR, profiler.profiler.pstats_text, route, sort)
+        await send_response(send, 200, body.encode(), content_type="text/plain")
+    else:
+        await send_json(send, {"status": "failed", "message": "Unknown profile format"}, 404)
+
+async def get_metrics(request, send):
+    body = await run(DB_EXECUTOR, metrics.render, api.results_cache, api.admission_control)
+    await send_response(send, 200, body.encode(), content_type="text/plain; version=0.0.4")
+
+async def _wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+async def stream_results(request, send, constituency_name=None):
+    """
+    Server-Sent Events from the shared tally publisher, one asyncio queue per open stream.
+    """
+
+    publisher = api.tally_publisher
+    if constituency_name is not None and not await run(DB_EXECUTOR, publisher.has_constituency, constituency_name):
+        await send_json(send, {"status": "failed", "message": "Unknown constituency"}, 404)
+        return
+
+    subscriber = stream.AsyncSubscriber(asyncio.get_running_loop(), constituency_name)
+    await run(DB_EXECUTOR, publisher.subscribe, constituency_name, subscriber)
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(request.receive))
+
+    try:
+        await send({"type": "http.response.start", "status": 200, "headers": _encode_headers([
+            ("Content-Type", "text/event-stream"),
+            ("Cache-Control", "no-cache"),
+            ("X-Accel-Buffering", "no"),
+            ("Access-Control-Allow-Origin", CORS_ORIGIN)
+        ])})
+
+        while not subscriber.closed:
+            next_event = asyncio.ensure_future(subscriber.events.get())
+            done, _ = await asyncio.wait({next_event, disconnected}, timeout=api.SSE_KEEPALIVE_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+
+            if next_event not in done:
+                next_event.cancel()
+                if disconnected in done:
+                    return
+                event = ": keep-alive\n\n"
+            else:
+                event = next_event.result()
+                if event is None:
+                    break
+
+            await send({"type": "http.response.body", "body": event.encode(), "more_body": True})
+
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        disconnected.cancel()
+        publisher.unsubscribe(subscriber)
+
+ROUTES = [
+    (("GET",), re.compile(r"/gevs/metrics"), "metrics", get_metrics),
+    (("GET", "POST", "DELETE"), re.compile(r"/gevs/profile"), "profile", profile),
+    (("GET",), re.compile(r"/gevs/profile/(?P<output_format>[^/]+)"), "profile", profile_output),
+    (("POST",), re.compile(r"/gevs/login"), "login", login),
+    (("POST",), re.compile(r"/gevs/register"), "register", register),
+    (("POST",), re.compile(r"/gevs/voters/import"), "import", import_voters),
+    (("GET",), re.compile(r"/gevs/audit/export"), "audit", export_audit),
+    (("GET",), re.compile(r"/gevs/constituency/(?P<constituency_name>[^/]+)/stream"), "stream", stream_results),
+    (("GET",), re.compile(r"/gevs/constituencies/stream"), "stream", stream_results),
+    (("GET",), re.compile(r"/gevs/constituency/(?P<constituency_name>[^/]+)"), "constituency", constituency_results),
+    (("GET",), re.compile(r"/gevs/results"), "results", election_results),
+    (("GET",), re.compile(r"/gevs/results/snapshot"), "results", export_election_results)
+]
+
+# Route patterns written the way Flask writes them, so both servers label their metrics the same
+RULES = {pattern: re.sub(r"\(\?P<(\w+)>[^)]*\)", r"<\1>", pattern.pattern) for _, pattern, _, _ in ROUTES}
+
+async def handle(route, handler, request, send, params):
+    """
+    Run a handler inside its route's concurrency limit, turning the request away with a 503 if no slot frees up in time.
+    """
+
+    slots = _route_slots[route]
+    try:
+        await asyncio.wait_for(slots.acquire(), ROUTE_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        await send_json(send, *api.BUSY)
+        return
+
+    try:
+        await handler(request, send, **params)
+    finally:
+        slots.release()
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            api.tally_publisher.stop()
+            DB_EXECUTOR.shutdown(wait=False)
+            HASH_EXECUTOR.shutdown(wait=False)
+            database.close_pools()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+
+    if scope["type"] != "http":
+        return
+
+    request = Request(scope, receive)
+    for methods, pattern, route, handler in ROUTES:
+        match = pattern.fullmatch(scope["path"])
+        if not match:
+            continue
+
+        method = scope["method"]
+        if method not in methods:
+            await send_json(send, {"status": "failed", "message": "Method not allowed"}, 405, [("Allow", ", ".join(methods))])
+            return
+
+        started = time.perf_counter()
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                metrics.record_request(RULES[pattern], method, message["status"], time.perf_counter() - started)
+            await send(message)
+
+        # Reading the profiler's output shouldn't show up in it, as in api.py
+        sampled = None
+        if route != "profile" and profiler.profiler.picks():
+            sampled = _sampled_route.set(f"{method} {RULES[pattern]}")
+
+        try:
+            await handle(route, handler, request, timed_send, match.groupdict())
+        except admission.Shed as shed:
+            await send_json(timed_send, shed.payload, shed.status)
+        except Exception as e:
+            print(f"Error handling {scope['path']}: {e}")
+            await send_json(timed_send, {"status": "failed"}, 500)
+        finally:
+            if sampled is not None:
+                _sampled_route.reset(sampled)
+        return
+
+    await send_json(send, {"status": "failed", "message": "Not found"}, 404)
+
+if __name__ == "__main__":
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("Serving asgi.py needs an ASGI server, e.g. pip install uvicorn, then run: uvicorn asgi:app --port 5001")
+
+    uvicorn.run("asgi:app", port=5001)
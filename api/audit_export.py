@@ -0,0 +1,211 @@
+import argparse
+import csv
+import hashlib
+import hmac
+import io
+import json
+import os
+import secrets
+import struct
+import sys
+from collections import Counter
+import database
+
+# Key for voter pseudonyms. Set it to get the same pseudonym for a voter in every export,
+# otherwise each export uses a fresh random key and pseudonyms cannot be linked between exports.
+PSEUDONYM_KEY = os.environ.get("GEVS_AUDIT_KEY")
+
+FORMATS = ("csv", "jsonl", "columnar")
+CSV_FIELDS = ("record", "voter", "constituency", "candidate_id", "candidate", "party", "vote_count")
+
+# Columnar layout: the magic, then blocks of a one byte kind and a little endian row count.
+# "B" blocks hold 16 byte voter pseudonyms, then constituency ids, then candidate ids (0 for no vote), as int64 columns.
+# "T" blocks hold candidate ids then vote counts. An "E" block with a row count of 0 ends the file.
+COLUMNAR_MAGIC = b"GEVSAUD1"
+PSEUDONYM_BYTES = 16
+_BLOCK = struct.Struct("<cI")
+
+class Pseudonymiser:
+    """
+    Replaces voter emails with keyed SHA-256 pseudonyms, or drops them entirely when pii is "strip".
+    """
+
+    def __init__(self, pii="hash", key=PSEUDONYM_KEY):
+        self.pii = pii
+        self.key = (key or secrets.token_hex(32)).encode()
+
+    def __call__(self, voter_id):
+        if self.pii == "strip":
+            return None
+        return hmac.new(self.key, voter_id.encode(), hashlib.sha256).digest()[:PSEUDONYM_BYTES]
+
+def export_records(database_file=database.DATABASE_FILE, pii="hash", batch_size=database.EXPORT_BATCH_SIZE):
+    """
+    Yield ("ballots", rows) batches of (pseudonym, constituency name, constituency id, candidate id),
+    then a single ("tallies", rows) batch of tally dictionaries.
+    Names, passwords, dates of birth and UVCs never leave the database; emails only as pseudonyms, if at all.
+    Without shards everything is read from one snapshot, so the tallies always match the ballots.
+    """
+
+    pseudonymise = Pseudonymiser(pii)
+
+    with database.Database(database_file) as db:
+        names = {constituency["constituency_id"]: constituency["constituency_name"] for constituency in db.get_constituencies()}
+
+        db.cursor.execute("BEGIN")
+        try:
+            for batch in db.iter_ballots(batch_size):
+                yield "ballots", [(pseudonymise(voter_id), names.get(constituency_id), constituency_id, candidate_id) for voter_id, constituency_id, candidate_id in batch]
+
+            yield "tallies", db.get_all_tallies()
+        finally:
+            db.cursor.connection.rollback()
+
+def _csv_rows(kind, rows):
+    if kind == "ballots":
+        for voter, constituency, _, candidate_id in rows:
+            yield ("ballot", voter.hex() if voter else "", constituency, "" if candidate_id is None else candidate_id, "", "", "")
+    else:
+        for tally in rows:
+            yield ("tally", "", tally["constituency"], tally["candidate_id"], tally["candidate"], tally["party"], tally["vote_count"])
+
+def _jsonl_rows(kind, rows):
+    if kind == "ballots":
+        for voter, constituency, _, candidate_id in rows:
+            yield {"record": "ballot", "voter": voter.hex() if voter else None, "constituency": constituency, "candidate_id": candidate_id}
+    else:
+        for tally in rows:
+            yield dict(tally, record="tally")
+
+def _columns(values):
+    return struct.pack(f"<{len(values)}q", *values)
+
+def render(records, file_format):
+    """
+    Turn export_records batches into chunks of bytes in the given format, one chunk per batch.
+    """
+
+    if file_format == "columnar":
+        yield COLUMNAR_MAGIC
+        for kind, rows in records:
+            if kind == "ballots":
+                yield _BLOCK.pack(b"B", len(rows))
+                yield b"".join(voter or bytes(PSEUDONYM_BYTES) for voter, _, _, _ in rows)
+                yield _columns([constituency_id for _, _, constituency_id, _ in rows])
+                yield _columns([candidate_id or 0 for _, _, _, candidate_id in rows])
+            else:
+                yield _BLOCK.pack(b"T", len(rows))
+                yield _columns([tally["candidate_id"] for tally in rows])
+                yield _columns([tally["vote_count"] for tally in rows])
+        yield _BLOCK.pack(b"E", 0)
+        return
+
+    first = True
+    for kind, rows in records:
+        if file_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if first:
+                writer.writerow(CSV_FIELDS)
+            writer.writerows(_csv_rows(kind, rows))
+            yield buffer.getvalue().encode()
+        else:
+            yield "".join(json.dumps(row) + "\n" for row in _jsonl_rows(kind, rows)).encode()
+        first = False
+
+def _read_exactly(file, size):
+    data = file.read(size)
+    if len(data) != size:
+        raise ValueError("Export is truncated")
+    return data
+
+def read_counts(file, file_format):
+    """
+    Read an export back a row or block at a time.
+    Returns a tuple of (ballots, Counter of votes per candidate id from the ballots, tallies by candidate id).
+    file is opened in binary mode.
+    """
+
+    ballots = 0
+    counted = Counter()
+    tallies = {}
+
+    if file_format == "columnar":
+        if file.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+            raise ValueError("Not a GEVS columnar export")
+
+        while True:
+            kind, count = _BLOCK.unpack(_read_exactly(file, _BLOCK.size))
+            if kind == b"E":
+                break
+            if kind == b"B":
+                _read_exactly(file, count * (PSEUDONYM_BYTES + 8))
+                candidate_ids = struct.unpack(f"<{count}q", _read_exactly(file, count * 8))
+                ballots += count
+                counted.update(candidate_id for candidate_id in candidate_ids if candidate_id)
+            elif kind == b"T":
+                candidate_ids = struct.unpack(f"<{count}q", _read_exactly(file, count * 8))
+                vote_counts = struct.unpack(f"<{count}q", _read_exactly(file, count * 8))
+                tallies.update(zip(candidate_ids, vote_counts))
+            else:
+                raise ValueError(f"Unknown block {kind!r}")
+        return ballots, counted, tallies
+
+    lines = io.TextIOWrapper(file, encoding="utf-8", newline="")
+    rows = csv.DictReader(lines) if file_format == "csv" else (json.loads(line) for line in lines if line.strip())
+    for row in rows:
+        if row["record"] == "ballot":
+            ballots += 1
+            if row["candidate_id"] not in ("", None):
+                counted[int(row["candidate_id"])] += 1
+        elif row["record"] == "tally":
+            tallies[int(row["candidate_id"])] = int(row["vote_count"])
+    return ballots, counted, tallies
+
+def verify(file, file_format):
+    """
+    Recount every candidate's votes from the exported ballots and compare them with the exported tallies.
+    Memory grows with the number of candidates, not voters.
+    Returns a tuple of (ballots read, list of mismatch descriptions).
+    """
+
+    ballots, counted, tallies = read_counts(file, file_format)
+
+    problems = []
+    for candidate_id in sorted(set(counted) | set(tallies)):
+        if counted.get(candidate_id, 0) != tallies.get(candidate_id, 0):
+            problems.append(f"Candidate {candidate_id} has a tally of {tallies.get(candidate_id, 0)} but {counted.get(candidate_id, 0)} ballots")
+    return ballots, problems
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream every ballot and tally out of the database for audit, with voters pseudonymised.")
+    parser.add_argument("output", help="file to write the export to, or to check with --verify-only")
+    parser.add_argument("--format", choices=FORMATS, help="export format, guessed from the extension if not given")
+    parser.add_argument("--pii", choices=["hash", "strip"], default="hash", help="replace voter emails with keyed hashes (set GEVS_AUDIT_KEY for stable ones) or drop them")
+    parser.add_argument("--database", default=database.DATABASE_FILE, help="database file to export from")
+    parser.add_argument("--batch-size", type=int, default=database.EXPORT_BATCH_SIZE, help="rows fetched per step")
+    parser.add_argument("--verify-only", action="store_true", help="only recount an existing export against its tallies")
+    args = parser.parse_args()
+
+    extension = os.path.splitext(args.output)[1].lstrip(".").lower()
+    file_format = args.format or {"csv": "csv", "jsonl": "jsonl"}.get(extension, "columnar")
+
+    if not args.verify_only:
+        with open(args.output, "wb") as file:
+            for chunk in render(export_records(args.database, args.pii, args.batch_size), file_format):
+                file.write(chunk)
+
+    with open(args.output, "rb") as file:
+        try:
+            ballots, problems = verify(file, file_format)
+        except (ValueError, KeyError, struct.error) as e:
+            sys.exit(f"Error during audit verification: {e}")
+
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    print(f"{args.output}: {ballots} ballots, tallies {'match' if not problems else 'DO NOT match'}", file=sys.stderr)
+    if problems:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
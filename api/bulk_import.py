@@ -0,0 +1,162 @@
+import argparse
+import csv
+import json
+import sys
+from itertools import islice
+import database
+import hashing
+
+FIELDS = ("email", "password", "full_name", "dob", "uvc", "constituency_id")
+CHUNK_SIZE = 1000
+
+def read_rows(lines, file_format):
+    """
+    Yield each row of a JSONL or CSV electoral roll as a dictionary.
+    Lines that cannot be parsed are yielded as {"_error": reason} so they still get a report entry.
+    """
+
+    if file_format == "csv":
+        yield from csv.DictReader(lines)
+        return
+
+    for line in lines:
+        if not line.strip():
+            continue
+
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            row = {"_error": f"Invalid JSON: {e}"}
+
+        yield row if isinstance(row, dict) else {"_error": "Row is not an object"}
+
+def _validate_chunk(chunk, constituencies, db):
+    """
+    Check a chunk of (row number, row) pairs without hashing anything.
+    Returns a tuple of (errors, accepted), errors being report entries and accepted the rows still worth importing.
+    """
+
+    errors = []
+    candidates = []
+    seen_emails = set()
+    seen_uvcs = set()
+
+    for number, row in chunk:
+        email = row.get("email")
+
+        if "_error" in row:
+            errors.append({"row": number, "email": email, "error": row["_error"]})
+            continue
+
+        missing = [field for field in FIELDS if not row.get(field)]
+        if missing:
+            errors.append({"row": number, "email": email, "error": f"Missing {', '.join(missing)}"})
+            continue
+
+        # JSONL rows can hold any JSON value, every field has to be text except constituency_id which may be a number
+        invalid = [field for field in FIELDS if not isinstance(row[field], str) and not (field == "constituency_id" and type(row[field]) is int)]
+        if invalid:
+            errors.append({"row": number, "email": email, "error": f"Invalid {', '.join(invalid)}"})
+            continue
+
+        try:
+            constituency_id = int(row["constituency_id"])
+        except (TypeError, ValueError):
+            constituency_id = None
+
+        if constituency_id not in constituencies:
+            errors.append({"row": number, "email": email, "error": "Unknown constituency"})
+        elif email in seen_emails:
+            errors.append({"row": number, "email": email, "error": "Email appears more than once"})
+        elif row["uvc"] in seen_uvcs:
+            errors.append({"row": number, "email": email, "error": "UVC appears more than once"})
+        else:
+            seen_emails.add(email)
+            seen_uvcs.add(row["uvc"])
+            candidates.append((number, row, constituency_id))
+
+    registered = db.get_registered_emails(seen_emails)
+    unused = db.get_unused_uvcs(seen_uvcs)
+
+    accepted = []
+    for number, row, constituency_id in candidates:
+        if row["email"] in registered:
+            errors.append({"row": number, "email": row["email"], "error": "Email already registered"})
+        elif row["uvc"] not in unused:
+            errors.append({"row": number, "email": row["email"], "error": "Invalid or already used UVC"})
+        else:
+            accepted.append((number, row, constituency_id))
+
+    return errors, accepted
+
+def import_voters(rows, database_file=database.DATABASE_FILE, chunk_size=CHUNK_SIZE):
+    """
+    Import voters from an iterable of row dictionaries a chunk at a time, so memory stays flat however long the roll is.
+    Yields a report entry for every rejected row, followed by a summary entry.
+    """
+
+    imported = 0
+    failed = 0
+    numbered = enumerate(rows, 1)
+
+    with database.Database(database_file) as db:
+        constituencies = {constituency["constituency_id"] for constituency in db.get_constituencies()}
+
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            break
+
+        with database.Database(database_file) as db:
+            errors, accepted = _validate_chunk(chunk, constituencies, db)
+
+        hashes = hashing.hash_passwords([row["password"] for _, row, _ in accepted])
+        hashed = []
+        voters = []
+        for (number, row, constituency_id), hashed_password in zip(accepted, hashes):
+            if hashed_password is None:
+                errors.append({"row": number, "email": row["email"], "error": "Invalid password"})
+                continue
+
+            hashed.append((number, row, constituency_id))
+            voters.append((row["email"], row["full_name"], row["dob"], hashed_password, row["uvc"], constituency_id))
+
+        with database.Database(database_file) as db:
+            rejected = db.register_voters(voters)
+
+        for number, row, _ in hashed:
+            if row["email"] in rejected:
+                errors.append({"row": number, "email": row["email"], "error": rejected[row["email"]]})
+
+        imported += len(hashed) - len(rejected)
+        failed += len(errors)
+
+        yield from sorted(errors, key=lambda error: error["row"])
+
+    yield {"imported": imported, "failed": failed}
+
+def main():
+    parser = argparse.ArgumentParser(description="Import an electoral roll of voters from a JSONL or CSV file.")
+    parser.add_argument("file", help="roll to import, one voter per line with " + ", ".join(FIELDS))
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="file format, guessed from the extension if not given")
+    parser.add_argument("--database", default=database.DATABASE_FILE, help="database file to import into")
+    parser.add_argument("--report", help="write the per-row error report here instead of stdout")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="rows per transaction")
+    args = parser.parse_args()
+
+    file_format = args.format or ("csv" if args.file.lower().endswith(".csv") else "jsonl")
+
+    with open(args.file, "r", newline="") as file:
+        report = open(args.report, "w") if args.report else sys.stdout
+        try:
+            for entry in import_voters(read_rows(file, file_format), args.database, args.chunk_size):
+                if "row" in entry:
+                    report.write(json.dumps(entry) + "\n")
+                else:
+                    print(f"Imported {entry['imported']} voters, {entry['failed']} rows failed", file=sys.stderr)
+        finally:
+            if report is not sys.stdout:
+                report.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,1101 @@
 import sqlite3
 import argon2
+import atexit
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from array import array
+from collections import Counter
+from bisect import bisect_left
+from concurrent.futures import Future
+from contextlib import contextmanager, nullcontext
+from itertools import islice
+
+# Connection pool settings, shared by every Database instance for the same file.
+POOL_SIZE = int(os.environ.get("GEVS_DB_POOL_SIZE", 8))
+POOL_TIMEOUT = float(os.environ.get("GEVS_DB_POOL_TIMEOUT", 30))
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KIB = 16384
+# Prepared statements kept per connection, enough for every fixed query in this module to stay compiled
+STATEMENT_CACHE_SIZE = 256
+
+# Default database, kept next to this file so it is the same whichever directory the apps start from
+DATABASE_FILE = os.environ.get("GEVS_DATABASE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "database.db"))
+
+# UVC codes are loaded from this file, a chunk per transaction
+UVC_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "UVCs.txt")
+UVC_CHUNK_SIZE = 10000
+# How often the in-memory UVC index checks the table for codes loaded by other processes
+UVC_INDEX_REFRESH_SECONDS = 60
+# How often cached constituencies and candidates check Reference_Version for changes
+REFERENCE_CHECK_SECONDS = 5
+# How long a voter's dashboard context is served from memory, and how many voters are kept. A TTL of 0 disables the cache.
+VOTER_CONTEXT_TTL = float(os.environ.get("GEVS_VOTER_CONTEXT_TTL", 5))
+VOTER_CONTEXT_CACHE_SIZE = int(os.environ.get("GEVS_VOTER_CONTEXT_CACHE_SIZE", 100000))
+
+# Group commit settings, votes are queued to one writer thread and committed in batches.
+GROUP_COMMIT = os.environ.get("GEVS_GROUP_COMMIT") == "1"
+GROUP_COMMIT_MAX_BATCH = int(os.environ.get("GEVS_GROUP_COMMIT_MAX_BATCH", 256))
+GROUP_COMMIT_WINDOW = float(os.environ.get("GEVS_GROUP_COMMIT_WINDOW", 0.005))
+
+# Rows fetched per step when streaming whole tables out, e.g. for the audit export
+EXPORT_BATCH_SIZE = 1000
+
+# Directory of per-constituency shard files that take ballots and tallies off the main database.
+# Unset keeps everything in the one database file.
+SHARD_DIRECTORY = os.environ.get("GEVS_SHARD_DIRECTORY") or None
+
+def open_connection(database_file):
+    """
+    Open a SQLite connection configured with WAL journaling and tuned pragmas.
+    synchronous stays FULL, as it is without WAL, so a vote or registration is fsynced before it is acknowledged.
+    """
+
+    connection = sqlite3.connect(database_file, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                                 cached_statements=STATEMENT_CACHE_SIZE)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    connection.execute("PRAGMA synchronous=FULL")
+    connection.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+    connection.execute("PRAGMA temp_store=MEMORY")
+    return connection
+
+# Errors caught and logged by the database layer rather than raised, counted by operation
+_error_counts = Counter()
+_error_counts_lock = threading.Lock()
+
+def _report_error(operation, e):
+    print(f"Error during {operation}: {e}")
+    with _error_counts_lock:
+        _error_counts[operation] += 1
+
+def error_stats():
+    """
+    Return how many errors of each operation have been logged and swallowed.
+    """
+
+    with _error_counts_lock:
+        return dict(_error_counts)
+
+class RegistrationFailed(Exception):
+    """
+    Raised by claim_registration when the voter could not be registered for a reason other than the email or UVC,
+    so callers can tell a server fault from a rejected registration.
+    """
+
+class Row:
+    """
+    Base for the result rows handed out by Database, one attribute per column held in __slots__.
+    They are much smaller and quicker to build than dictionaries, and still support row["column"], dict(row) and ==.
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def keys(self):
+        return self.__slots__
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, key) == getattr(other, key) for key in self.__slots__)
+
+    # Rows compare by value but their columns can be reassigned, so they are not hashable
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{key}={getattr(self, key)!r}' for key in self.__slots__)})"
+
+class ConstituencyRow(Row):
+    __slots__ = ("constituency_id", "constituency_name")
+
+    def __init__(self, constituency_id, constituency_name):
+        self.constituency_id = constituency_id
+        self.constituency_name = constituency_name
+
+class CandidateRow(Row):
+    __slots__ = ("id", "name", "party", "constituency_id")
+
+    def __init__(self, id, name, party, constituency_id):
+        self.id = id
+        self.name = name
+        self.party = party
+        self.constituency_id = constituency_id
+
+class TallyRow(Row):
+    __slots__ = ("candidate_id", "candidate", "party", "constituency", "vote_count")
+
+    def __init__(self, candidate_id, candidate, party, constituency, vote_count):
+        self.candidate_id = candidate_id
+        self.candidate = candidate
+        self.party = party
+        self.constituency = constituency
+        self.vote_count = vote_count
+
+class SeatRow(Row):
+    __slots__ = ("party", "seat")
+
+    def __init__(self, party, seat):
+        self.party = party
+        self.seat = seat
+
+class VoterContext(Row):
+    __slots__ = ("status", "constituency_id", "has_voted", "candidates")
+
+    def __init__(self, status, constituency_id, has_voted, candidates):
+        self.status = status
+        self.constituency_id = constituency_id
+        self.has_voted = has_voted
+        self.candidates = candidates
+
+def _apply_vote(cursor, email, candidate_id):
+    """
+    Record a vote and increment the tally as one unit.
+    The voter row is only updated if they have not voted yet and the election is ongoing, so a second or late vote never counts.
+    Returns True if the vote was recorded, False otherwise.
+    """
+
+    cursor.execute("""
+        UPDATE Voter SET selected_candidate_id = ?
+        WHERE voter_id = ? AND selected_candidate_id IS NULL
+        AND EXISTS (SELECT 1 FROM Candidate WHERE canid = ?)
+        AND (SELECT status FROM Election) = 'ONGOING'
+    """, (candidate_id, email, candidate_id))
+
+    if cursor.rowcount != 1:
+        return False
+
+    cursor.execute("UPDATE Candidate SET vote_count = vote_count + 1 WHERE canid = ?", (candidate_id,))
+    _update_constituency_result(cursor, candidate_id)
+    _bump_results_version(cursor)
+    return True
+
+def _bump_results_version(cursor):
+    """
+    Mark the results as changed, so anything cached against the old version is no longer served.
+    """
+
+    cursor.execute("UPDATE Results_Version SET version = version + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER)")
+
+def _update_constituency_result(cursor, candidate_id):
+    """
+    Keep Constituency_Result and Party_Seat in step after a candidate gains a vote.
+    Only that candidate's count changed, so the seat can only move to them; nothing is rescanned.
+    Ties go to the candidate with the lowest id, matching rebuild_results.
+    """
+
+    # Use the stored id, candidate_id may have arrived as a string from a form
+    cursor.execute("SELECT canid, constituency_id, party_id, vote_count FROM Candidate WHERE canid = ?", (candidate_id,))
+    candidate_id, constituency_id, party_id, vote_count = cursor.fetchone()
+
+    cursor.execute("SELECT candidate_id, party_id, vote_count FROM Constituency_Result WHERE constituency_id = ?", (constituency_id,))
+    leader = cursor.fetchone()
+
+    if leader and leader[0] == candidate_id:
+        cursor.execute("UPDATE Constituency_Result SET vote_count = ? WHERE constituency_id = ?", (vote_count, constituency_id))
+        return
+
+    if leader and (leader[2] > vote_count or (leader[2] == vote_count and leader[0] < candidate_id)):
+        return
+
+    cursor.execute("""
+        INSERT INTO Constituency_Result (constituency_id, candidate_id, party_id, vote_count)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (constituency_id) DO UPDATE SET
+            candidate_id = excluded.candidate_id,
+            party_id = excluded.party_id,
+            vote_count = excluded.vote_count
+    """, (constituency_id, candidate_id, party_id, vote_count))
+
+    if leader is None or leader[1] != party_id:
+        if leader is not None:
+            cursor.execute("UPDATE Party_Seat SET seat = seat - 1 WHERE party_id = ?", (leader[1],))
+
+        cursor.execute("""
+            INSERT INTO Party_Seat (party_id, seat) VALUES (?, 1)
+            ON CONFLICT (party_id) DO UPDATE SET seat = seat + 1
+        """, (party_id,))
+
+def national_result(seat_results):
+    """
+    Work out the national winner from get_seats_by_party's list, a tie for most seats is a hung parliament.
+    Returns the /gevs/results payload, or None if there are no parties to count.
+    """
+
+    if not seat_results:
+        return None
+
+    max_seat_count = max(result["seat"] for result in seat_results)
+    winning_party = next((result["party"] for result in seat_results if result["seat"] == max_seat_count), "")
+
+    # Check if thers a tie
+    if list(result["seat"] for result in seat_results).count(max_seat_count) > 1:
+        winner = "Hung Parliament"
+    else:
+        winner = winning_party
+
+    return {
+        "status": "Completed",
+        "winner": winner,
+        "seats": [{"party": result["party"], "seat": result["seat"]} for result in seat_results]
+    }
+
+class ConnectionPool:
+    """
+    Bounded pool of long-lived SQLite connections to a single database file.
+    Connections are opened lazily (up to max_size), configured once with WAL and tuned pragmas,
+    health checked when handed out and rolled back when returned.
+    """
+
+    def __init__(self, database_file, max_size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.database_file = database_file
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._closed = False
+        # Times a caller had to wait for a connection to come back, and how long they waited in total
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except sqlite3.Error:
+            pass
+
+        with self._lock:
+            self._opened -= 1
+
+    @staticmethod
+    def _is_healthy(connection):
+        try:
+            connection.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self):
+        """
+        Return a healthy connection, opening a new one if the pool has room.
+        Raises sqlite3.OperationalError if none becomes free within the timeout.
+        """
+
+        while True:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Connection pool has been closed")
+
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_open = self._opened < self.max_size
+                    if can_open:
+                        self._opened += 1
+
+                if can_open:
+                    try:
+                        return open_connection(self.database_file)
+                    except sqlite3.Error:
+                        with self._lock:
+                            self._opened -= 1
+                        raise
+
+                started = time.perf_counter()
+                try:
+                    connection = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self.timeouts += 1
+                    raise sqlite3.OperationalError("Timed out waiting for a pooled database connection")
+                finally:
+                    with self._lock:
+                        self.waits += 1
+                        self.wait_seconds += time.perf_counter() - started
+
+            if self._is_healthy(connection):
+                return connection
+
+            # Broken connection, drop it and try again
+            self._discard(connection)
+
+    def release(self, connection):
+        """
+        Return a connection to the pool, discarding any uncommitted work.
+        """
+
+        if self._closed:
+            self._discard(connection)
+            return
+
+        try:
+            connection.rollback()
+        except sqlite3.Error:
+            self._discard(connection)
+            return
+
+        self._idle.put(connection)
+
+    def health_check(self):
+        """
+        Check every idle connection, replacing any that are broken.
+        Returns a dictionary describing the state of the pool.
+        """
+
+        checked = []
+        while True:
+            try:
+                checked.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+        healthy = 0
+        for connection in checked:
+            if self._is_healthy(connection):
+                healthy += 1
+                self._idle.put(connection)
+            else:
+                self._discard(connection)
+
+        return {
+            "database_file": self.database_file,
+            "max_size": self.max_size,
+            "opened": self._opened,
+            "idle": self._idle.qsize(),
+            "healthy_idle": healthy,
+            "closed": self._closed
+        }
+
+    def stats(self):
+        """
+        Return the pool's size and wait counters as a dictionary, without touching any connection.
+        """
+
+        with self._lock:
+            return {
+                "max_size": self.max_size,
+                "opened": self._opened,
+                "idle": self._idle.qsize(),
+                "waits": self.waits,
+                "wait_seconds": self.wait_seconds,
+                "timeouts": self.timeouts
+            }
+
+    def close(self):
+        """
+        Close every idle connection. Connections still in use are closed when they are released.
+        """
+
+        self._closed = True
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(connection)
+
+class VoteWriter:
+    """
+    Single writer thread that applies queued votes in batched transactions (group commit).
+    A batch closes after max_batch votes or window seconds, whichever comes first,
+    and every vote in it is acknowledged only once the batch has been committed.
+    """
+
+    def __init__(self, database_file, max_batch=GROUP_COMMIT_MAX_BATCH, window=GROUP_COMMIT_WINDOW):
+        self.database_file = database_file
+        self.max_batch = max_batch
+        self.window = window
+        self._queue = queue.Queue()
+        self._closed = False
+
+        self._connection = open_connection(database_file)
+        # Acknowledged votes must survive a power cut, open_connection's synchronous=FULL fsyncs every batch commit
+        self._connection.isolation_level = None
+
+        self._thread = threading.Thread(target=self._run, name="gevs-vote-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, email, candidate_id):
+        """
+        Queue a vote and return a Future resolving to True or False once its batch is durable.
+        """
+
+        if self._closed:
+            raise sqlite3.ProgrammingError("Vote writer has been closed")
+
+        future = Future()
+        self._queue.put((email, candidate_id, future))
+        return future
+
+    def _run(self):
+        running = True
+        while running:
+            item = self._queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+
+            self._apply_batch(batch)
+
+        self._connection.close()
+
+    def _apply_batch(self, batch):
+        """
+        Apply and commit one batch, then resolve its futures.
+        Anything that goes wrong fails the batch's futures rather than the writer thread, which carries on with the next batch.
+        """
+
+        cursor = None
+        results = []
+
+        try:
+            cursor = self._connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            for email, candidate_id, _ in batch:
+                # Savepoint per vote so one bad ballot does not take the rest of the batch with it
+                cursor.execute("SAVEPOINT vote")
+                try:
+                    results.append(_apply_vote(cursor, email, candidate_id))
+                    cursor.execute("RELEASE vote")
+                except Exception as e:
+                    _report_error("vote submission", e)
+                    cursor.execute("ROLLBACK TO vote")
+                    cursor.execute("RELEASE vote")
+                    results.append(False)
+
+            cursor.execute("COMMIT")
+
+        except Exception as e:
+            _report_error("batched vote submission", e)
+            try:
+                if self._connection.in_transaction:
+                    self._connection.rollback()
+            except Exception as rollback_error:
+                _report_error("batched vote rollback", rollback_error)
+
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        finally:
+            if cursor is not None:
+                cursor.close()
+
+        for (_, _, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def close(self):
+        """
+        Stop accepting votes, flush everything already queued and stop the writer thread.
+        """
+
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+
+class UVCIndex:
+    """
+    Compact in-memory copy of UVC_Code, used to reject bad or used codes without a query.
+    Each code is packed into a 64 bit integer in a sorted array, with a parallel byte marking it used.
+    It only ever answers "definitely not usable"; a code that passes is still checked against the database.
+    """
+
+    def __init__(self):
+        # (codes, used, enabled, max_rowid), replaced as a whole so readers never mix two refreshes
+        self._state = (array("Q"), bytearray(), False, None)
+        self._stale = True
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _encode(uvc):
+        data = uvc.encode() if isinstance(uvc, str) else None
+        if data is None or len(data) > 8:
+            return None
+        return int.from_bytes(data.ljust(8, b"\0"), "big")
+
+    @staticmethod
+    def _position(codes, key):
+        if key is None:
+            return None
+        position = bisect_left(codes, key)
+        if position < len(codes) and codes[position] == key:
+            return position
+        return None
+
+    def refresh(self, cursor):
+        """
+        Rebuild the index from UVC_Code, streaming rows in code order so no sort is needed.
+        Codes too long to pack switch the index off and every check goes to the database.
+        """
+
+        with self._lock:
+            codes = array("Q")
+            used = bytearray()
+            enabled = True
+
+            cursor.execute("SELECT MAX(rowid) FROM UVC_Code")
+            max_rowid = cursor.fetchone()[0]
+
+            cursor.execute("SELECT UVC, used FROM UVC_Code ORDER BY UVC")
+            while enabled:
+                rows = cursor.fetchmany(UVC_CHUNK_SIZE)
+                if not rows:
+                    break
+
+                for uvc, is_used in rows:
+                    key = self._encode(uvc)
+                    if key is None:
+                        enabled = False
+                        break
+                    codes.append(key)
+                    used.append(1 if is_used else 0)
+
+            self._state = (codes, used, True, max_rowid) if enabled else (array("Q"), bytearray(), False, max_rowid)
+            self._stale = False
+            self._checked_at = time.monotonic()
+
+    def invalidate(self):
+        self._stale = True
+
+    def _refresh_if_moved(self, cursor):
+        """
+        Rebuild the index if codes have been added since it was built, by this process or another.
+        Returns True if it was rebuilt.
+        """
+
+        cursor.execute("SELECT MAX(rowid) FROM UVC_Code")
+        if self._stale or cursor.fetchone()[0] != self._state[3]:
+            self.refresh(cursor)
+            return True
+
+        self._checked_at = time.monotonic()
+        return False
+
+    def might_be_unused(self, cursor, uvc):
+        """
+        Return False if the UVC is certainly unknown or used, True if the database has to decide.
+        A code the index has not seen costs one MAX(rowid) lookup, rebuilding the index only if codes were added meanwhile.
+        """
+
+        if self._stale or time.monotonic() - self._checked_at >= UVC_INDEX_REFRESH_SECONDS:
+            self._refresh_if_moved(cursor)
+
+        codes, used, enabled, _ = self._state
+        if not enabled:
+            return True
+
+        key = self._encode(uvc)
+        position = self._position(codes, key)
+        if position is None:
+            # Another process may have loaded the code since the index was built
+            if not self._refresh_if_moved(cursor):
+                return False
+
+            codes, used, enabled, _ = self._state
+            if not enabled:
+                return True
+            position = self._position(codes, key)
+
+        return position is not None and not used[position]
+
+    def mark_used(self, uvc):
+        codes, used, enabled, _ = self._state
+        position = self._position(codes, self._encode(uvc)) if enabled else None
+        if position is not None:
+            used[position] = 1
+
+class ReferenceCache:
+    """
+    Process-local copy of the constituencies and each constituency's candidates, which barely change during an election.
+    Reloaded when Reference_Version (bumped by triggers) moves, checked at most every REFERENCE_CHECK_SECONDS.
+    The lists handed out are shared, so callers must not modify them.
+    """
+
+    def __init__(self):
+        self._version = None
+        self._checked_at = 0
+        self._constituencies = []
+        self._candidates = {}
+        self._lock = threading.Lock()
+
+    def _load(self, cursor):
+        cursor.execute("SELECT constituency_id, constituency_name FROM Constituency")
+        constituencies = [ConstituencyRow(*constituency) for constituency in cursor.fetchall()]
+
+        cursor.execute("""
+            SELECT Candidate.canid, Candidate.candidate, Party.party, Candidate.constituency_id
+            FROM Candidate
+            JOIN Party ON Candidate.party_id = Party.party_id
+        """)
+        candidates = {}
+        for candidate in cursor.fetchall():
+            candidates.setdefault(candidate[3], []).append(CandidateRow(*candidate))
+
+        self._constituencies = constituencies
+        self._candidates = candidates
+
+    def _refresh(self, cursor):
+        with self._lock:
+            if time.monotonic() - self._checked_at < REFERENCE_CHECK_SECONDS:
+                return
+
+            cursor.execute("SELECT version FROM Reference_Version")
+            version = cursor.fetchone()[0]
+
+            if version != self._version:
+                self._load(cursor)
+                self._version = version
+            self._checked_at = time.monotonic()
+
+    def invalidate(self):
+        self._checked_at = 0
+
+    def constituencies(self, cursor):
+        self._refresh(cursor)
+        return self._constituencies
+
+    def candidates(self, cursor, constituency_id):
+        self._refresh(cursor)
+        return self._candidates.get(constituency_id, [])
+
+class VoterContextCache:
+    """
+    Per-voter copy of get_voter_context, so a voter reloading the dashboard costs no query.
+    Entries expire after the TTL and are dropped as soon as the voter votes; changing the election status drops them all.
+    At most max_size voters are kept, the oldest entry making room for the newest.
+    """
+
+    def __init__(self, ttl=VOTER_CONTEXT_TTL, max_size=VOTER_CONTEXT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, email):
+        with self._lock:
+            entry = self._entries.get(email)
+
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    def put(self, email, context):
+        if self.ttl <= 0:
+            return
+
+        with self._lock:
+            self._entries.pop(email, None)
+            while self._entries and len(self._entries) >= self.max_size:
+                del self._entries[next(iter(self._entries))]
+            self._entries[email] = (time.monotonic() + self.ttl, context)
+
+    def invalidate(self, email=None):
+        """
+        Drop one voter's entry, or every entry if no email is given.
+        """
+
+        with self._lock:
+            if email is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(email, None)
+
+class ShardSet:
+    """
+    One SQLite file per constituency holding its ballots and tallies, so votes in different constituencies
+    are written to different files and never queue on the same write lock, across threads or processes.
+    Voter accounts, candidates, reference data and the election status stay in the main database.
+    Reads keep one connection per shard and only re-read a shard whose PRAGMA data_version has moved.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._ready = set()
+        self._readers = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, constituency_id):
+        return os.path.join(self.directory, f"constituency-{int(constituency_id)}.db")
+
+    def _prepare(self, constituency_id):
+        """
+        Create the shard's tables the first time this process uses it.
+        """
+
+        if constituency_id in self._ready:
+            return
+
+        connection = open_connection(self.path(constituency_id))
+        try:
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS Ballot (
+                    voter_id TEXT PRIMARY KEY,
+                    candidate_id INTEGER NOT NULL,
+                    cast_at INTEGER
+                );
+                CREATE TABLE IF NOT EXISTS Tally (
+                    candidate_id INTEGER PRIMARY KEY,
+                    vote_count INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS Shard_Version (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    version INTEGER,
+                    updated_at INTEGER
+                );
+                INSERT OR IGNORE INTO Shard_Version (id, version, updated_at)
+                VALUES (1, 0, CAST(strftime('%s', 'now') AS INTEGER));
+            """)
+        finally:
+            connection.close()
+
+        self._ready.add(constituency_id)
+
+    def _pool(self, constituency_id):
+        self._prepare(constituency_id)
+        return get_pool(self.path(constituency_id))
+
+    def cast_vote(self, email, constituency_id, candidate_id, is_open=None):
+        """
+        Record a ballot and count it in the constituency's shard.
+        The ballot's primary key is the voter, so a second vote is ignored rather than counted.
+        is_open, if given, is called once the shard's write lock is held and the ballot is only recorded if it returns True.
+        Returns True if the vote was recorded, False otherwise.
+        """
+
+        pool = self._pool(constituency_id)
+        connection = pool.acquire()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            if is_open is not None and not is_open():
+                connection.rollback()
+                return False
+
+            cursor.execute("""
+                INSERT OR IGNORE INTO Ballot (voter_id, candidate_id, cast_at)
+                VALUES (?, ?, CAST(strftime('%s', 'now') AS INTEGER))
+            """, (email, candidate_id))
+
+            voted = cursor.rowcount == 1
+            if voted:
+                cursor.execute("""
+                    INSERT INTO Tally (candidate_id, vote_count) VALUES (?, 1)
+                    ON CONFLICT (candidate_id) DO UPDATE SET vote_count = vote_count + 1
+                """, (candidate_id,))
+                cursor.execute("UPDATE Shard_Version SET version = version + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER)")
+
+            connection.commit()
+            return voted
+        finally:
+            pool.release(connection)
+
+    @contextmanager
+    def locked(self, constituency_ids):
+        """
+        Hold the write lock of every listed shard while the block runs, so no ballot lands in any of them meanwhile.
+        Locks are taken in constituency order and released, with nothing written, when the block ends.
+        """
+
+        held = []
+        try:
+            for constituency_id in sorted(constituency_ids):
+                pool = self._pool(constituency_id)
+                connection = pool.acquire()
+                held.append((pool, connection))
+                connection.execute("BEGIN IMMEDIATE")
+            yield
+        finally:
+            for pool, connection in reversed(held):
+                connection.rollback()
+                pool.release(connection)
+
+    def has_voted(self, email, constituency_id):
+        pool = self._pool(constituency_id)
+        connection = pool.acquire()
+        try:
+            return connection.execute("SELECT 1 FROM Ballot WHERE voter_id = ?", (email,)).fetchone() is not None
+        finally:
+            pool.release(connection)
+
+    def _reader(self, constituency_id):
+        with self._lock:
+            reader = self._readers.get(constituency_id)
+            if reader is None:
+                self._prepare(constituency_id)
+                # [connection, data_version last read, (version, updated_at, counts), lock]
+                reader = self._readers[constituency_id] = [open_connection(self.path(constituency_id)), None, (0, 0, {}), threading.Lock()]
+            return reader
+
+    def _read(self, constituency_id):
+        reader = self._reader(constituency_id)
+        with reader[3]:
+            connection = reader[0]
+            data_version = connection.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != reader[1]:
+                connection.execute("BEGIN")
+                try:
+                    version, updated_at = connection.execute("SELECT version, updated_at FROM Shard_Version").fetchone()
+                    counts = dict(connection.execute("SELECT candidate_id, vote_count FROM Tally").fetchall())
+                finally:
+                    connection.rollback()
+                reader[1] = data_version
+                reader[2] = (version, updated_at, counts)
+
+            return reader[2]
+
+    def read(self, constituency_ids):
+        """
+        Get each shard's (version, updated_at, {candidate_id: vote_count}), keyed by constituency id.
+        Shards nobody has written to since the last read are served from memory.
+        Each shard is read under its own lock, so readers of different shards never wait on each other.
+        """
+
+        return {constituency_id: self._read(constituency_id) for constituency_id in constituency_ids}
+
+    def iter_ballots(self, constituency_id, batch_size=EXPORT_BATCH_SIZE):
+        """
+        Yield the shard's (voter_id, candidate_id) ballots in lists of up to batch_size, read from one snapshot.
+        """
+
+        pool = self._pool(constituency_id)
+        connection = pool.acquire()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("BEGIN")
+            cursor.execute("SELECT voter_id, candidate_id FROM Ballot ORDER BY rowid")
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                yield batch
+        finally:
+            pool.release(connection)
+
+    def rebuild(self, constituency_id):
+        """
+        Recount a shard's tallies from its ballots.
+        """
+
+        pool = self._pool(constituency_id)
+        connection = pool.acquire()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute("DELETE FROM Tally")
+            connection.execute("INSERT INTO Tally (candidate_id, vote_count) SELECT candidate_id, COUNT(*) FROM Ballot GROUP BY candidate_id")
+            connection.execute("UPDATE Shard_Version SET version = version + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER)")
+            connection.commit()
+        finally:
+            pool.release(connection)
+
+    def check(self, constituency_id, candidate_ids):
+        """
+        Compare a shard's tallies with its ballots, and its ballots with the constituency's candidates.
+        Returns a list of descriptions of every mismatch.
+        """
+
+        problems = []
+        pool = self._pool(constituency_id)
+        connection = pool.acquire()
+        try:
+            counted = dict(connection.execute("SELECT candidate_id, vote_count FROM Tally").fetchall())
+            cast = dict(connection.execute("SELECT candidate_id, COUNT(*) FROM Ballot GROUP BY candidate_id").fetchall())
+        finally:
+            pool.release(connection)
+
+        for candidate_id in sorted(set(counted) | set(cast)):
+            if counted.get(candidate_id, 0) != cast.get(candidate_id, 0):
+                problems.append(f"Candidate {candidate_id} has vote_count {counted.get(candidate_id, 0)} but {cast.get(candidate_id, 0)} votes were cast")
+            if candidate_id not in candidate_ids:
+                problems.append(f"Constituency {constituency_id} shard has votes for candidate {candidate_id}, who is not standing there")
+
+        return problems
+
+    def close(self):
+        with self._lock:
+            for reader in self._readers.values():
+                with reader[3]:
+                    reader[0].close()
+            self._readers.clear()
+
+_pools = {}
+_pools_lock = threading.Lock()
+_vote_writers = {}
+_shard_sets = {}
+_uvc_indexes = {}
+_reference_caches = {}
+_voter_context_caches = {}
+
+def _pool_key(database_file):
+    return database_file if database_file == ":memory:" else os.path.abspath(database_file)
+
+def get_pool(database_file):
+    """
+    Return the shared connection pool for a database file, creating it on first use.
+    """
+
+    key = _pool_key(database_file)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool._closed:
+            # An in-memory database only exists inside its one connection
+            max_size = 1 if database_file == ":memory:" else POOL_SIZE
+            pool = _pools[key] = ConnectionPool(database_file, max_size=max_size)
+        return pool
+
+def pool_stats():
+    """
+    Return the stats of every open pool, keyed by database file.
+    """
+
+    with _pools_lock:
+        pools = list(_pools.items())
+    return {key: pool.stats() for key, pool in pools}
+
+def get_uvc_index(database_file):
+    """
+    Return the shared UVC index for a database file, creating it on first use.
+    """
+
+    key = _pool_key(database_file)
+    with _pools_lock:
+        index = _uvc_indexes.get(key)
+        if index is None:
+            index = _uvc_indexes[key] = UVCIndex()
+        return index
+
+def get_reference_cache(database_file):
+    """
+    Return the shared reference data cache for a database file, creating it on first use.
+    """
+
+    key = _pool_key(database_file)
+    with _pools_lock:
+        cache = _reference_caches.get(key)
+        if cache is None:
+            cache = _reference_caches[key] = ReferenceCache()
+        return cache
+
+def get_voter_context_cache(database_file):
+    """
+    Return the shared voter context cache for a database file, creating it on first use.
+    """
+
+    key = _pool_key(database_file)
+    with _pools_lock:
+        cache = _voter_context_caches.get(key)
+        if cache is None:
+            cache = _voter_context_caches[key] = VoterContextCache()
+        return cache
+
+def get_shard_set(directory):
+    """
+    Return the shared shard set for a directory, creating it on first use.
+    """
+
+    key = os.path.abspath(directory)
+    with _pools_lock:
+        shards = _shard_sets.get(key)
+        if shards is None:
+            shards = _shard_sets[key] = ShardSet(directory)
+        return shards
+
+def enable_group_commit(enabled=True):
+    """
+    Switch cast_vote between group commit through a VoteWriter and committing each vote directly.
+    """
+
+    global GROUP_COMMIT
+    GROUP_COMMIT = enabled
+
+def get_vote_writer(database_file):
+    """
+    Return the shared vote writer for a database file, or None if group commit is disabled.
+    """
+
+    if not GROUP_COMMIT or database_file == ":memory:":
+        return None
+
+    key = _pool_key(database_file)
+    with _pools_lock:
+        writer = _vote_writers.get(key)
+        if writer is None or writer._closed:
+            writer = _vote_writers[key] = VoteWriter(database_file)
+        return writer
+
+@atexit.register
+def close_pools():
+    """
+    Flush and stop every vote writer, then close every connection pool, used on shutdown.
+    """
+
+    with _pools_lock:
+        for writer in _vote_writers.values():
+            writer.close()
+        _vote_writers.clear()
+
+        for shards in _shard_sets.values():
+            shards.close()
+        _shard_sets.clear()
+
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
 
 class Database:
-    def __init__(self, database_file="database.db"):
-        self.connection = sqlite3.connect(database_file)
+    def __init__(self, database_file=DATABASE_FILE, shard_directory=SHARD_DIRECTORY):
+        self.pool = get_pool(database_file)
+        self.connection = self.pool.acquire()
         self.cursor = self.connection.cursor()
+        # Ballots and tallies live in per-constituency shards when a shard directory is set
+        self.shards = get_shard_set(shard_directory) if shard_directory else None
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self.connection.close()
+        self.close()
+
+    def close(self):
+        """
+        Hand the connection back to the pool rather than closing it.
+        """
+
+        if self.connection is not None:
+            self.cursor.close()
+            self.pool.release(self.connection)
+            self.connection = None
 
     def _create_tables(self):
         """
@@ -38,65 +1123,291 @@ class Database:
         """)
 
         self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS UVC_Code (
-                UVC TEXT PRIMARY KEY,
-                used INTEGER
+            CREATE TABLE IF NOT EXISTS UVC_Code (
+                UVC TEXT PRIMARY KEY,
+                used INTEGER
+            )
+        """)
+
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS Candidate (
+                canid INTEGER PRIMARY KEY AUTOINCREMENT,
+                candidate TEXT,
+                party_id INTEGER,
+                constituency_id INTEGER,
+                vote_count INTEGER,
+                FOREIGN KEY (party_id) REFERENCES Party (party_id),
+                FOREIGN KEY (constituency_id) REFERENCES Constituency (constituency_id)
+            )
+        """)
+
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS Voter (
+                voter_id TEXT PRIMARY KEY,
+                full_name TEXT,
+                DOB DATE,
+                password TEXT,
+                UVC TEXT,
+                constituency_id INTEGER,
+                selected_candidate_id INTEGER,
+                FOREIGN KEY (constituency_id) REFERENCES Constituency (constituency_id),
+                FOREIGN KEY (selected_candidate_id) REFERENCES Candidate (canid)
+            )
+        """)
+
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS Commissioner (
+                commissioner_id TEXT PRIMARY KEY,
+                password TEXT
+            )
+        """)
+
+    def _create_results_tables(self):
+        """
+        Adds the materialised results tables and fills them from the votes already cast,
+        along with UVC_Load, which records how far load_uvc_codes has got through each UVC file.
+        """
+
+        # Materialised results, kept up to date by cast_vote and rebuilt by rebuild_results
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS Constituency_Result (
+                constituency_id INTEGER PRIMARY KEY,
+                candidate_id INTEGER,
+                party_id INTEGER,
+                vote_count INTEGER,
+                FOREIGN KEY (constituency_id) REFERENCES Constituency (constituency_id),
+                FOREIGN KEY (candidate_id) REFERENCES Candidate (canid),
+                FOREIGN KEY (party_id) REFERENCES Party (party_id)
+            )
+        """)
+
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS Party_Seat (
+                party_id INTEGER PRIMARY KEY,
+                seat INTEGER,
+                FOREIGN KEY (party_id) REFERENCES Party (party_id)
+            )
+        """)
+
+        # Single row counter bumped whenever votes or the election status change
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS Results_Version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER,
+                updated_at INTEGER
+            )
+        """)
+
+        # Progress of each UVC file loaded by load_uvc_codes
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS UVC_Load (
+                source TEXT PRIMARY KEY,
+                lines_loaded INTEGER,
+                complete INTEGER
+            )
+        """)
+
+        self.cursor.execute("""
+            INSERT OR IGNORE INTO Results_Version (id, version, updated_at)
+            VALUES (1, 0, CAST(strftime('%s', 'now') AS INTEGER))
+        """)
+
+        self._rebuild_results()
+
+    def _create_indexes(self):
+        """
+        Adds indexes on the columns the voting and results queries filter on.
+        """
+
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS Voter_constituency_id ON Voter (constituency_id)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS Voter_selected_candidate_id ON Voter (selected_candidate_id)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS Candidate_constituency_id ON Candidate (constituency_id)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS Constituency_constituency_name ON Constituency (constituency_name)")
+
+    def _create_reference_version(self):
+        """
+        Adds Reference_Version, bumped by triggers whenever constituencies, parties or candidates change
+        (but not when a candidate's vote count does), so cached copies know to reload.
+        """
+
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS Reference_Version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER
+            )
+        """)
+        self.cursor.execute("INSERT OR IGNORE INTO Reference_Version (id, version) VALUES (1, 0)")
+
+        changes = {
+            "Constituency": ["INSERT", "DELETE", "UPDATE"],
+            "Party": ["INSERT", "DELETE", "UPDATE"],
+            "Candidate": ["INSERT", "DELETE", "UPDATE OF candidate, party_id, constituency_id"]
+        }
+        for table, events in changes.items():
+            for event in events:
+                self.cursor.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS {table}_{event.split()[0].lower()}_reference_version
+                    AFTER {event} ON {table}
+                    BEGIN
+                        UPDATE Reference_Version SET version = version + 1;
+                    END
+                """)
+
+    def _create_results_snapshot(self):
+        """
+        Adds Results_Snapshot, the final results written once when the election concludes.
+        A trigger refuses updates; later migrations also stop it being deleted or the election reopened.
+        """
+
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS Results_Snapshot (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                results_version INTEGER,
+                created_at INTEGER,
+                checksum TEXT,
+                body BLOB
             )
         """)
 
         self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS Candidate (
-                canid INTEGER PRIMARY KEY AUTOINCREMENT,
-                candidate TEXT,
-                party_id INTEGER,
-                constituency_id INTEGER,
-                vote_count INTEGER,
-                FOREIGN KEY (party_id) REFERENCES Party (party_id),
-                FOREIGN KEY (constituency_id) REFERENCES Constituency (constituency_id)
-            )
+            CREATE TRIGGER IF NOT EXISTS Results_Snapshot_immutable
+            BEFORE UPDATE ON Results_Snapshot
+            BEGIN
+                SELECT RAISE(ABORT, 'Results snapshot is immutable');
+            END
         """)
 
+        # Elections that concluded before this migration get their snapshot now
+        if self.get_election_status() == "CONCLUDED":
+            self._freeze_results()
+
+    def _protect_results_snapshot(self):
+        """
+        Refuses deleting Results_Snapshot while the election is concluded.
+        """
+
         self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS Voter (
-                voter_id TEXT PRIMARY KEY,
-                full_name TEXT,
-                DOB DATE,
-                password TEXT,
-                UVC TEXT,
-                constituency_id INTEGER,
-                selected_candidate_id INTEGER,
-                FOREIGN KEY (constituency_id) REFERENCES Constituency (constituency_id),
-                FOREIGN KEY (selected_candidate_id) REFERENCES Candidate (canid)
-            )
+            CREATE TRIGGER IF NOT EXISTS Results_Snapshot_undeletable
+            BEFORE DELETE ON Results_Snapshot
+            WHEN (SELECT status FROM Election) = 'CONCLUDED'
+            BEGIN
+                SELECT RAISE(ABORT, 'Results snapshot is immutable');
+            END
         """)
 
+    def _lock_concluded_election(self):
+        """
+        Refuses moving a concluded election to any other status, so the tallies cannot change again
+        and the published snapshot and its checksum stay the record for good.
+        """
+
         self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS Commissioner (
-                commissioner_id TEXT PRIMARY KEY,
-                password TEXT
-            )
+            CREATE TRIGGER IF NOT EXISTS Election_concluded_final
+            BEFORE UPDATE OF status ON Election
+            WHEN OLD.status = 'CONCLUDED' AND NEW.status IS NOT 'CONCLUDED'
+            BEGIN
+                SELECT RAISE(ABORT, 'A concluded election cannot be reopened');
+            END
         """)
 
-        self.cursor.connection.commit()
+    def _create_base_schema(self):
+        self._create_tables()
+        self._populate_other_tables()
+
+    # Schema migrations in order, PRAGMA user_version records how many have been applied.
+    # Never edit or reorder one that has shipped, only append.
+    MIGRATIONS = (
+        "_create_base_schema",
+        "_create_results_tables",
+        "_create_indexes",
+        "_create_reference_version",
+        "_create_results_snapshot",
+        "_protect_results_snapshot",
+        "_lock_concluded_election",
+    )
 
-    def _populate_uvc_codes(self):
+    def migrate(self):
         """
-        Populates the UVC_Code table with codes from UVCS.txt.
+        Apply any migrations the database has not had yet, each in its own transaction.
+        When the schema is already current this costs a single PRAGMA read.
+        Returns True if any migration ran, False otherwise.
         """
 
-        self.cursor.execute("SELECT COUNT(*) FROM UVC_Code")
-        count = self.cursor.fetchone()[0]
+        self.cursor.execute("PRAGMA user_version")
+        if self.cursor.fetchone()[0] >= len(self.MIGRATIONS):
+            return False
 
-        # If table empty...
-        if count == 0:
-            with open("UVCs.txt", "r") as file:
-                uvc_list = [line.strip() for line in file]
+        migrated = False
+        for number, migration in enumerate(self.MIGRATIONS, 1):
+            self.cursor.execute("BEGIN IMMEDIATE")
+            try:
+                # Another process may have got here first while we waited for the lock
+                self.cursor.execute("PRAGMA user_version")
+                if self.cursor.fetchone()[0] >= number:
+                    self.cursor.connection.rollback()
+                    continue
 
-            # Insert UVCs into the UVC_Code table
-            self.cursor.executemany("INSERT INTO UVC_Code (UVC, used) VALUES (?, 0)", [(uvc,) for uvc in uvc_list])
+                getattr(self, migration)()
+                self.cursor.execute(f"PRAGMA user_version = {number}")
+                self.cursor.connection.commit()
+                migrated = True
 
-            # Commit changes
-            self.cursor.connection.commit()
+            except Exception:
+                self.cursor.connection.rollback()
+                raise
+
+        return migrated
+
+    def _populate_uvc_codes(self, uvc_file=UVC_FILE):
+        """
+        Populates the UVC_Code table with codes from UVCs.txt.
+        """
+
+        self.load_uvc_codes(uvc_file)
+
+    def load_uvc_codes(self, uvc_file, chunk_size=UVC_CHUNK_SIZE):
+        """
+        Stream UVCs from a file, one per line, into the UVC_Code table a chunk at a time.
+        Codes already in the table are skipped, and progress is committed with each chunk
+        so an interrupted load carries on from where it stopped. A file loaded to the end is read on from there too,
+        so codes appended to it later are picked up.
+        Returns the number of new codes added.
+        """
+
+        source = os.path.abspath(uvc_file)
+        self.cursor.execute("SELECT lines_loaded FROM UVC_Load WHERE source = ?", (source,))
+        progress = self.cursor.fetchone()
+        lines_loaded = progress[0] if progress else 0
+
+        inserted = 0
+        with open(uvc_file, "r") as file:
+            lines = islice(file, lines_loaded, None)
+
+            while True:
+                chunk = list(islice(lines, chunk_size))
+                if not chunk:
+                    break
+
+                before = self.connection.total_changes
+                self.cursor.executemany("INSERT OR IGNORE INTO UVC_Code (UVC, used) VALUES (?, 0)", [(line.strip(),) for line in chunk if line.strip()])
+                inserted += self.connection.total_changes - before
+                lines_loaded += len(chunk)
+
+                self.cursor.execute("""
+                    INSERT INTO UVC_Load (source, lines_loaded, complete) VALUES (?, ?, 0)
+                    ON CONFLICT (source) DO UPDATE SET lines_loaded = excluded.lines_loaded
+                """, (source, lines_loaded))
+                self.cursor.connection.commit()
+
+        self.cursor.execute("""
+            INSERT INTO UVC_Load (source, lines_loaded, complete) VALUES (?, ?, 1)
+            ON CONFLICT (source) DO UPDATE SET lines_loaded = excluded.lines_loaded, complete = 1
+        """, (source, lines_loaded))
+        self.cursor.connection.commit()
+
+        if inserted:
+            get_uvc_index(self.pool.database_file).invalidate()
+        return inserted
 
     def _populate_other_tables(self):
         self.cursor.execute("SELECT COUNT(*) FROM Election")
@@ -139,8 +1450,6 @@ class Database:
                 VALUES (?, ?)
                 """, ("election@shangrila.gov.sr", hashed_password))
 
-            self.cursor.connection.commit()
-
     def get_login(self, email):
         """
         Return the password assigned to the email, if it exists.
@@ -168,6 +1477,41 @@ class Database:
         else:
             return None
 
+    def get_account(self, email):
+        """
+        Find which kind of account the email belongs to with a single query.
+        Returns a tuple of (account type, password), or None if there is no such account.
+        """
+        self.cursor.execute("""
+            SELECT 'commissioner', password FROM Commissioner WHERE commissioner_id = ?
+            UNION ALL
+            SELECT 'voter', password FROM Voter WHERE voter_id = ?
+            LIMIT 1
+        """, (email, email))
+        result = self.cursor.fetchone()
+
+        if result:
+            return result[0], result[1]
+        else:
+            return None
+
+    def update_password(self, account, email, password):
+        """
+        Replace the saved password hash of a commissioner or voter account.
+        Returns True if the update is successful, False otherwise.
+        """
+        try:
+            if account == "commissioner":
+                self.cursor.execute("UPDATE Commissioner SET password = ? WHERE commissioner_id = ?", (password, email))
+            else:
+                self.cursor.execute("UPDATE Voter SET password = ? WHERE voter_id = ?", (password, email))
+
+            self.cursor.connection.commit()
+            return True
+        except Exception as e:
+            _report_error("password update", e)
+            return False
+
     def is_email_registered(self, email):
         """
         Check if the given email is already registered.
@@ -184,42 +1528,166 @@ class Database:
         If the UVC is valid, return True. Otherwise, return False.
         """
 
+        # Unknown and used codes are turned away by the in-memory index without a query
+        if not get_uvc_index(self.pool.database_file).might_be_unused(self.cursor, uvc):
+            return False
+
         self.cursor.execute("SELECT COUNT(*) FROM UVC_Code WHERE UVC = ? AND used = 0", (uvc,))
         count = self.cursor.fetchone()[0]
         return bool(count > 0)
 
-    def register_voter(self, email, full_name, dob, password, uvc, constituency_id):
+    def get_registered_emails(self, emails):
         """
-        Register a new voter and return the voter_id/email.
-        Otherwise, return None.
+        Check a batch of emails with one query.
+        Returns the set of those emails that are already registered.
         """
-        
+        emails = list(emails)
+        if not emails:
+            return set()
+
+        # One JSON parameter rather than one per email, so batches are not capped by SQLITE_MAX_VARIABLE_NUMBER
+        self.cursor.execute("SELECT voter_id FROM Voter WHERE voter_id IN (SELECT value FROM json_each(?))", (json.dumps(emails),))
+        return {result[0] for result in self.cursor.fetchall()}
+
+    def get_unused_uvcs(self, uvcs):
+        """
+        Check a batch of UVCs with one query.
+        Returns the set of those UVCs that are valid and not used.
+        """
+        uvcs = list(uvcs)
+        if not uvcs:
+            return set()
+
+        self.cursor.execute("SELECT UVC FROM UVC_Code WHERE used = 0 AND UVC IN (SELECT value FROM json_each(?))", (json.dumps(uvcs),))
+        return {result[0] for result in self.cursor.fetchall()}
+
+    def register_voters(self, voters):
+        """
+        Register a batch of voters in one transaction.
+        voters is a list of (email, full_name, dob, password, uvc, constituency_id) tuples.
+        Emails and UVCs are checked again inside the transaction, so nothing claimed meanwhile is reused.
+        Returns a dictionary mapping the email of every rejected voter to the reason.
+        """
+        rejected = {}
+
+        try:
+            self.cursor.execute("BEGIN IMMEDIATE")
+            registered = self.get_registered_emails(voter[0] for voter in voters)
+            unused = self.get_unused_uvcs(voter[4] for voter in voters)
+
+            accepted = []
+            for voter in voters:
+                if voter[0] in registered:
+                    rejected[voter[0]] = "Email already registered"
+                elif voter[4] not in unused:
+                    rejected[voter[0]] = "Invalid or already used UVC"
+                else:
+                    accepted.append(voter)
+
+            self.cursor.executemany("""
+                INSERT INTO Voter (voter_id, full_name, DOB, password, UVC, constituency_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, accepted)
+
+            # Mark UVCs as used
+            self.cursor.executemany("UPDATE UVC_Code SET used = 1 WHERE UVC = ?", [(voter[4],) for voter in accepted])
+            self.cursor.connection.commit()
+
+            index = get_uvc_index(self.pool.database_file)
+            for voter in accepted:
+                index.mark_used(voter[4])
+            return rejected
+
+        except Exception as e:
+            _report_error("bulk voter registration", e)
+            self.cursor.connection.rollback()
+            return {voter[0]: "Registration failed" for voter in voters}
+
+    def check_registration(self, email, uvc):
+        """
+        Check with one query whether the email is free and the UVC is valid and unused, before any hashing is done.
+        Returns None if registration can go ahead, otherwise the reason it would be rejected.
+        The answer can go stale, claim_registration is what actually decides.
+        """
+
+        # Unknown and used codes are turned away by the in-memory index without looking the email up
+        if not get_uvc_index(self.pool.database_file).might_be_unused(self.cursor, uvc):
+            return "Invalid or already used UVC"
+
+        self.cursor.execute("""
+            SELECT EXISTS (SELECT 1 FROM Voter WHERE voter_id = ?),
+                EXISTS (SELECT 1 FROM UVC_Code WHERE UVC = ? AND used = 0)
+        """, (email, uvc))
+        email_registered, uvc_unused = self.cursor.fetchone()
+
+        if email_registered:
+            return "Email already registered"
+        if not uvc_unused:
+            return "Invalid or already used UVC"
+        return None
+
+    def claim_registration(self, email, full_name, dob, password, uvc, constituency_id):
+        """
+        Claim the UVC and create the voter in one immediate transaction.
+        The UVC is only claimed if it is still unused and the voter only inserted if the email is still free,
+        both decided by the statements' row counts, so two registrations can never share a UVC or an email.
+        Returns None if the voter was registered, otherwise the reason they were rejected.
+        Raises RegistrationFailed if the transaction itself failed.
+        """
+
         try:
+            self.cursor.execute("BEGIN IMMEDIATE")
+            self.cursor.execute("UPDATE UVC_Code SET used = 1 WHERE UVC = ? AND used = 0", (uvc,))
+            if self.cursor.rowcount != 1:
+                self.cursor.connection.rollback()
+                return "Invalid or already used UVC"
+
             self.cursor.execute("""
                 INSERT INTO Voter (voter_id, full_name, DOB, password, UVC, constituency_id)
                 VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (voter_id) DO NOTHING
             """, (email, full_name, dob, password, uvc, constituency_id))
+            if self.cursor.rowcount != 1:
+                self.cursor.connection.rollback()
+                return "Email already registered"
 
-            # Mark UVC as used
-            self.cursor.execute("UPDATE UVC_Code SET used = 1 WHERE UVC = ?", (uvc,))
             self.cursor.connection.commit()
-            return email
-        
+            get_uvc_index(self.pool.database_file).mark_used(uvc)
+            return None
+
         except Exception as e:
-            print(f"Error during voter registration: {e}")
+            _report_error("voter registration", e)
+            self.cursor.connection.rollback()
+            raise RegistrationFailed(str(e)) from e
+
+    def register_voter(self, email, full_name, dob, password, uvc, constituency_id):
+        """
+        Register a new voter and return the voter_id/email.
+        Otherwise, return None.
+        """
+
+        try:
+            rejection = self.claim_registration(email, full_name, dob, password, uvc, constituency_id)
+        except RegistrationFailed:
             return None
 
+        return email if rejection is None else None
+
     def get_constituency_results(self, constituency_name):
         """
         Get election results for a specific constituency and return as a dictionary.
         If no results are available, return None.
         """
+        if self.shards is not None:
+            return self._get_sharded_constituency_results(constituency_name)
+
         self.cursor.execute("""
             SELECT Candidate.candidate, Party.party, Candidate.vote_count
             FROM Candidate
             JOIN Party ON Candidate.party_id = Party.party_id
-            JOIN Constituency ON Candidate.constituency_id = Constituency.constituency_id
-            WHERE Constituency.constituency_name = ?
+            WHERE Candidate.constituency_id = (
+                SELECT constituency_id FROM Constituency WHERE constituency_name = ?
+            )
         """, (constituency_name,))
 
         results = self.cursor.fetchall()
@@ -228,27 +1696,225 @@ class Database:
             return results
         else:
             return None
-    
-    def get_seats_by_party(self):
+
+    def _get_sharded_constituency_results(self, constituency_name):
+        # Only the shard of the constituency asked for is read
+        constituencies = [constituency for constituency in self.get_constituencies() if constituency["constituency_name"] == constituency_name]
+        for _, candidates in self._shard_results(constituencies):
+            return [(candidate["name"], candidate["party"], candidate["vote_count"]) for candidate in candidates] or None
+        return None
+
+    def _shard_results(self, constituencies=None):
+        """
+        Merge each shard's tallies with the candidates standing in its constituency, for every constituency by default.
+        Returns a list of (constituency, candidates) pairs, each candidate dictionary with its vote_count added.
+        """
+        if constituencies is None:
+            constituencies = self.get_constituencies()
+        shards = self.shards.read(constituency["constituency_id"] for constituency in constituencies)
+
+        results = []
+        for constituency in constituencies:
+            _, _, counts = shards[constituency["constituency_id"]]
+            candidates = [dict(candidate, vote_count=counts.get(candidate["id"], 0)) for candidate in self.get_constituency_candidates(constituency["constituency_id"])]
+            results.append((constituency, candidates))
+        return results
+
+    def get_all_tallies(self):
         """
-        Get the count of seats won by each party.
-        Returns a list of dictionaries containing each parties seat count.
+        Get the current vote count of every candidate in every constituency.
+        Returns a list of TallyRows containing candidate id, name, party, constituency name and vote count.
         """
+        if self.shards is not None:
+            return [
+                TallyRow(candidate["id"], candidate["name"], candidate["party"], constituency["constituency_name"], candidate["vote_count"])
+                for constituency, candidates in self._shard_results()
+                for candidate in candidates
+            ]
+
         self.cursor.execute("""
-            SELECT Party.party, COUNT(Candidate.canid) as seat
+            SELECT Candidate.canid, Candidate.candidate, Party.party, Constituency.constituency_name, Candidate.vote_count
             FROM Candidate
             JOIN Party ON Candidate.party_id = Party.party_id
-            GROUP BY Party.party
+            JOIN Constituency ON Candidate.constituency_id = Constituency.constituency_id
+        """)
+
+        return [TallyRow(*tally) for tally in self.cursor.fetchall()]
+
+    def get_seats_by_party(self):
+        """
+        Get the count of seats won by each party, where a seat is a constituency the party's candidate leads.
+        Returns a list of SeatRows containing each parties seat count.
+        """
+        if self.shards is not None:
+            return self._get_sharded_seats_by_party()
+
+        self.cursor.execute("""
+            SELECT Party.party, COALESCE(Party_Seat.seat, 0) as seat
+            FROM Party
+            LEFT JOIN Party_Seat ON Party.party_id = Party_Seat.party_id
+            ORDER BY Party.party
+        """)
+
+        return [SeatRow(*result) for result in self.cursor.fetchall()]
+
+    def _get_sharded_seats_by_party(self):
+        seats = Counter()
+        for _, candidates in self._shard_results():
+            # Ties go to the candidate with the lowest id, as in rebuild_results
+            contenders = [candidate for candidate in candidates if candidate["vote_count"] > 0]
+            if contenders:
+                leader = min(contenders, key=lambda candidate: (-candidate["vote_count"], candidate["id"]))
+                seats[leader["party"]] += 1
+
+        self.cursor.execute("SELECT party FROM Party ORDER BY party")
+        return [SeatRow(party, seats[party]) for (party,) in self.cursor.fetchall()]
+
+    def get_results_version(self):
+        """
+        Get the current results version and the unix time it last changed.
+        Returns a tuple of (version, updated_at).
+        """
+        self.cursor.execute("SELECT version, updated_at FROM Results_Version")
+        result = self.cursor.fetchone()
+        version, updated_at = result if result else (0, 0)
+
+        # Every shard's version only goes up, so their sum with the main one still changes whenever any of them does
+        if self.shards is not None:
+            constituency_ids = [constituency["constituency_id"] for constituency in self.get_constituencies()]
+            for shard_version, shard_updated_at, _ in self.shards.read(constituency_ids).values():
+                version += shard_version
+                updated_at = max(updated_at, shard_updated_at)
+
+        return version, updated_at
+
+    def rebuild_results(self):
+        """
+        Rebuild vote counts, constituency leaders and party seats from scratch using Voter.selected_candidate_id.
+        With shards, each shard's tallies are recounted from its ballots instead; leaders and seats are worked out when read.
+        Returns True if the rebuild is successful, False otherwise.
+        """
+        try:
+            if self.shards is not None:
+                for constituency in self.get_constituencies():
+                    self.shards.rebuild(constituency["constituency_id"])
+                return True
+
+            self._rebuild_results()
+            self.cursor.connection.commit()
+            return True
+        except Exception as e:
+            _report_error("results rebuild", e)
+            self.cursor.connection.rollback()
+            return False
+
+    def _rebuild_results(self):
+        self.cursor.execute("""
+            UPDATE Candidate SET vote_count = (
+                SELECT COUNT(*) FROM Voter WHERE Voter.selected_candidate_id = Candidate.canid
+            )
+        """)
+
+        self.cursor.execute("DELETE FROM Constituency_Result")
+        self.cursor.execute("""
+            INSERT INTO Constituency_Result (constituency_id, candidate_id, party_id, vote_count)
+            SELECT constituency_id, canid, party_id, vote_count FROM (
+                SELECT constituency_id, canid, party_id, vote_count,
+                    ROW_NUMBER() OVER (PARTITION BY constituency_id ORDER BY vote_count DESC, canid) AS position
+                FROM Candidate
+                WHERE vote_count > 0
+            )
+            WHERE position = 1
+        """)
+
+        self.cursor.execute("DELETE FROM Party_Seat")
+        self.cursor.execute("""
+            INSERT INTO Party_Seat (party_id, seat)
+            SELECT party_id, COUNT(*) FROM Constituency_Result GROUP BY party_id
+        """)
+
+        _bump_results_version(self.cursor)
+
+    def check_results(self):
+        """
+        Compare the materialised results against the raw votes in Voter.selected_candidate_id.
+        Returns a list of descriptions of every mismatch, empty if the results are consistent.
+        """
+        problems = []
+
+        if self.shards is not None:
+            for constituency in self.get_constituencies():
+                candidate_ids = {candidate["id"] for candidate in self.get_constituency_candidates(constituency["constituency_id"])}
+                problems.extend(self.shards.check(constituency["constituency_id"], candidate_ids))
+            return problems
+
+        self.cursor.execute("""
+            SELECT Candidate.canid, Candidate.vote_count, COUNT(Voter.voter_id)
+            FROM Candidate
+            LEFT JOIN Voter ON Voter.selected_candidate_id = Candidate.canid
+            GROUP BY Candidate.canid
+            HAVING Candidate.vote_count IS NOT COUNT(Voter.voter_id)
         """)
+        for canid, vote_count, actual in self.cursor.fetchall():
+            problems.append(f"Candidate {canid} has vote_count {vote_count} but {actual} votes were cast")
 
-        seats_results = self.cursor.fetchall()
-        return [{"party": result[0], "seat": result[1]} for result in seats_results]
+        self.cursor.execute("""
+            SELECT Voter.voter_id, Voter.selected_candidate_id
+            FROM Voter
+            LEFT JOIN Candidate ON Voter.selected_candidate_id = Candidate.canid
+            WHERE Voter.selected_candidate_id IS NOT NULL AND Candidate.canid IS NULL
+        """)
+        for voter_id, candidate_id in self.cursor.fetchall():
+            problems.append(f"Voter {voter_id} voted for unknown candidate {candidate_id}")
+
+        self.cursor.execute("""
+            WITH Tally AS (
+                SELECT Candidate.canid, Candidate.constituency_id, Candidate.party_id, COUNT(Voter.voter_id) AS votes
+                FROM Candidate
+                LEFT JOIN Voter ON Voter.selected_candidate_id = Candidate.canid
+                GROUP BY Candidate.canid
+            ),
+            Leader AS (
+                SELECT constituency_id, canid, votes FROM (
+                    SELECT constituency_id, canid, votes,
+                        ROW_NUMBER() OVER (PARTITION BY constituency_id ORDER BY votes DESC, canid) AS position
+                    FROM Tally
+                    WHERE votes > 0
+                )
+                WHERE position = 1
+            )
+            SELECT Constituency.constituency_id, Leader.canid, Leader.votes, Constituency_Result.candidate_id, Constituency_Result.vote_count
+            FROM Constituency
+            LEFT JOIN Leader ON Leader.constituency_id = Constituency.constituency_id
+            LEFT JOIN Constituency_Result ON Constituency_Result.constituency_id = Constituency.constituency_id
+            WHERE Leader.canid IS NOT Constituency_Result.candidate_id
+                OR Leader.votes IS NOT Constituency_Result.vote_count
+        """)
+        for constituency_id, expected, votes, stored, stored_votes in self.cursor.fetchall():
+            problems.append(f"Constituency {constituency_id} should be led by candidate {expected} ({votes} votes) but has {stored} ({stored_votes} votes)")
+
+        self.cursor.execute("""
+            SELECT Party.party_id, COALESCE(Party_Seat.seat, 0), COUNT(Constituency_Result.constituency_id)
+            FROM Party
+            LEFT JOIN Party_Seat ON Party_Seat.party_id = Party.party_id
+            LEFT JOIN Constituency_Result ON Constituency_Result.party_id = Party.party_id
+            GROUP BY Party.party_id
+            HAVING COALESCE(Party_Seat.seat, 0) != COUNT(Constituency_Result.constituency_id)
+        """)
+        for party_id, seat, actual in self.cursor.fetchall():
+            problems.append(f"Party {party_id} has {seat} seats but leads {actual} constituencies")
+
+        return problems
 
     def has_voter_voted(self, email):
         """
         Check if the voter has already voted.
         Returns True or False.
         """
+        if self.shards is not None:
+            constituency_id = self.get_voter_constituency(email)
+            return constituency_id is not None and self.shards.has_voted(email, constituency_id)
+
         self.cursor.execute("SELECT selected_candidate_id FROM Voter WHERE voter_id = ?", (email,))
         result = self.cursor.fetchone()
 
@@ -256,37 +1922,106 @@ class Database:
 
     def cast_vote(self, email, candidate_id):
         """
-        Cast the vote for the specified candidate.
-        Returns True or None depending on whether the vote was successful.
+        Cast the vote for the specified candidate, unless the voter has already voted.
+        With group commit enabled the vote is handed to the shared writer thread and this waits for its batch.
+        Returns True or False depending on whether the vote was successful.
         """
         try:
-            self.cursor.execute("UPDATE Voter SET selected_candidate_id = ? WHERE voter_id = ?", (candidate_id, email))
-            self.cursor.execute("UPDATE Candidate SET vote_count = vote_count + 1 WHERE canid = ?", (candidate_id,))
+            return self._cast_vote(email, candidate_id)
+        finally:
+            # Dropped after the vote, so a dashboard read meanwhile cannot cache the voter as not having voted
+            get_voter_context_cache(self.pool.database_file).invalidate(email)
+
+    def _cast_vote(self, email, candidate_id):
+        if self.shards is not None:
+            return self._cast_sharded_vote(email, candidate_id)
 
+        writer = get_vote_writer(self.pool.database_file)
+        if writer:
+            try:
+                return writer.submit(email, candidate_id).result(timeout=POOL_TIMEOUT)
+            except Exception as e:
+                _report_error("vote submission", e)
+                return False
+
+        try:
+            # Take the write lock up front, _apply_vote's conditional update then decides whether the vote counts
+            self.cursor.execute("BEGIN IMMEDIATE")
+            voted = _apply_vote(self.cursor, email, candidate_id)
             self.cursor.connection.commit()
-            return True
+            return voted
         
         except Exception as e:
-            print(f"Error during vote submission: {e}")
+            _report_error("vote submission", e)
+            self.cursor.connection.rollback()
+            return False
+
+    def _cast_sharded_vote(self, email, candidate_id):
+        """
+        Cast the vote in the voter's constituency shard, if the candidate is standing there.
+        """
+        try:
+            constituency_id = self.get_voter_constituency(email)
+            if constituency_id is None:
+                return False
+
+            candidates = self.get_constituency_candidates(constituency_id)
+            if not any(str(candidate["id"]) == str(candidate_id) for candidate in candidates):
+                return False
+
+            # The status lives in the main database, so it is checked with the shard locked instead of in the same statement
+            return self.shards.cast_vote(email, constituency_id, int(candidate_id), is_open=lambda: self.get_election_status() == "ONGOING")
+
+        except Exception as e:
+            _report_error("vote submission", e)
             return False
 
+    def iter_ballots(self, batch_size=EXPORT_BATCH_SIZE):
+        """
+        Yield every voter's (voter_id, constituency_id, selected_candidate_id) in lists of up to batch_size.
+        One cursor steps through the table, so memory stays flat however large the electorate is.
+        Without shards this reads inside the caller's transaction, if one is open.
+        With shards only voters who have voted appear, each constituency read from its own shard.
+        """
+        if self.shards is not None:
+            for constituency in self.get_constituencies():
+                constituency_id = constituency["constituency_id"]
+                for batch in self.shards.iter_ballots(constituency_id, batch_size):
+                    yield [(voter_id, constituency_id, candidate_id) for voter_id, candidate_id in batch]
+            return
+
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute("SELECT voter_id, constituency_id, selected_candidate_id FROM Voter ORDER BY rowid")
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                yield batch
+        finally:
+            cursor.close()
+
     def get_all_candidates(self):
         """
         Fetch all candidates with their ids, names, parties, and constituency ids.
-        Returns a list of dictionaries containing candidate id, name, party, and constituency id.
+        Returns a list of CandidateRows containing candidate id, name, party, and constituency id.
         """
         self.cursor.execute("SELECT Candidate.canid, Candidate.candidate, Party.party, Candidate.constituency_id FROM Candidate JOIN Party ON Candidate.party_id = Party.party_id")
-        candidates = self.cursor.fetchall()
-        return [{"id": candidate[0], "name": candidate[1], "party": candidate[2], "constituency_id": candidate[3]} for candidate in candidates]
+        return [CandidateRow(*candidate) for candidate in self.cursor.fetchall()]
 
     def get_constituencies(self):
         """
-        Get all constituencies and return as a list of dictionaries.
+        Get all constituencies and return as a list of ConstituencyRows.
+        Served from the process-wide reference data cache.
         """
-        self.cursor.execute("SELECT constituency_id, constituency_name FROM Constituency")
-        constituencies = self.cursor.fetchall()
+        return get_reference_cache(self.pool.database_file).constituencies(self.cursor)
 
-        return [{"constituency_id": constituency[0], "constituency_name": constituency[1]} for constituency in constituencies]
+    def get_constituency_candidates(self, constituency_id):
+        """
+        Get the candidates standing in one constituency from the reference data cache.
+        Returns a list of CandidateRows containing candidate id, name, party, and constituency id.
+        """
+        return get_reference_cache(self.pool.database_file).candidates(self.cursor, constituency_id)
     
     def get_voter_constituency(self, voter_id):
         self.cursor.execute("SELECT constituency_id FROM Voter WHERE voter_id = ?", (voter_id,))
@@ -297,6 +2032,42 @@ class Database:
         else:
             return None
 
+    def get_voter_context(self, email):
+        """
+        Get everything the voter dashboard needs in one indexed query: the election status, the voter's constituency,
+        whether they have voted and the candidates standing in their constituency.
+        Served from the per-voter cache while fresh. With shards, whether they have voted comes from their shard.
+        Returns a VoterContext, or None if there is no such voter.
+        """
+        cache = get_voter_context_cache(self.pool.database_file)
+        context = cache.get(email)
+        if context is not None:
+            return context
+
+        self.cursor.execute("""
+            SELECT Election.status, Voter.constituency_id, Voter.selected_candidate_id IS NOT NULL,
+                Candidate.canid, Candidate.candidate, Party.party
+            FROM Voter
+            LEFT JOIN Election ON 1
+            LEFT JOIN Candidate ON Candidate.constituency_id = Voter.constituency_id
+            LEFT JOIN Party ON Party.party_id = Candidate.party_id
+            WHERE Voter.voter_id = ?
+            ORDER BY Candidate.canid
+        """, (email,))
+        results = self.cursor.fetchall()
+
+        if not results:
+            return None
+
+        status, constituency_id, has_voted = results[0][:3]
+        candidates = [CandidateRow(result[3], result[4], result[5], constituency_id) for result in results if result[3] is not None]
+        if self.shards is not None:
+            has_voted = constituency_id is not None and self.shards.has_voted(email, constituency_id)
+
+        context = VoterContext(status, constituency_id, bool(has_voted), candidates)
+        cache.put(email, context)
+        return context
+
     def get_election_status(self):
         self.cursor.execute("SELECT status FROM ELECTION")
         result = self.cursor.fetchone()
@@ -309,12 +2080,75 @@ class Database:
     def update_election_status(self, new_status):
         """
         Update the election status in the Election table.
+        Concluding the election freezes the results into Results_Snapshot in the same transaction,
+        and is final: moving a concluded election to any other status is refused, here and by a trigger.
         Returns True if the update is successful, False otherwise.
         """
         try:
-            self.cursor.execute("UPDATE Election SET status = ?", (new_status,))
-            self.cursor.connection.commit()
+            self.cursor.execute("BEGIN IMMEDIATE")
+            status = self.get_election_status()
+            # Setting the status it already has changes nothing, so concluding twice keeps the first snapshot
+            if status == new_status:
+                self.cursor.connection.commit()
+                return True
+
+            if status == "CONCLUDED":
+                self.cursor.connection.rollback()
+                return False
+
+            # Sharded votes check the status with their shard locked, so holding every shard until the commit
+            # makes the snapshot one consistent read: each ballot is either in it or sees CONCLUDED and is refused
+            shards = nullcontext()
+            if new_status == "CONCLUDED" and self.shards is not None:
+                shards = self.shards.locked(constituency["constituency_id"] for constituency in self.get_constituencies())
+
+            with shards:
+                self.cursor.execute("UPDATE Election SET status = ?", (new_status,))
+                _bump_results_version(self.cursor)
+
+                if new_status == "CONCLUDED":
+                    self._freeze_results()
+
+                self.cursor.connection.commit()
+            get_voter_context_cache(self.pool.database_file).invalidate()
             return True
         except Exception as e:
-            print(f"Error during election status update: {e}")
-            return False
\ No newline at end of file
+            _report_error("election status update", e)
+            self.cursor.connection.rollback()
+            return False
+
+    def _freeze_results(self):
+        """
+        Render the final national and per-constituency results once and store them with their SHA-256 checksum.
+        The JSON is canonical (sorted keys, no whitespace) so the same results always give the same checksum.
+        """
+
+        version, updated_at = self.get_results_version()
+        snapshot = national_result(self.get_seats_by_party()) or {"status": "Completed", "winner": "", "seats": []}
+
+        constituencies = {}
+        for tally in sorted(self.get_all_tallies(), key=lambda tally: (tally["constituency"], tally["candidate_id"])):
+            constituencies.setdefault(tally["constituency"], []).append({"candidate": tally["candidate"], "party": tally["party"], "vote_count": tally["vote_count"]})
+
+        snapshot["constituencies"] = [{"constituency": name, "results": results} for name, results in constituencies.items()]
+        snapshot["results_version"] = version
+        snapshot["concluded_at"] = updated_at
+
+        body = json.dumps(snapshot, sort_keys=True, separators=(",", ":")).encode()
+        self.cursor.execute("""
+            INSERT INTO Results_Snapshot (id, results_version, created_at, checksum, body)
+            VALUES (1, ?, ?, ?, ?)
+        """, (version, updated_at, hashlib.sha256(body).hexdigest(), body))
+
+    def get_results_snapshot(self):
+        """
+        Get the results frozen when the election concluded.
+        Returns a tuple of (body, checksum, created_at) where body is the snapshot's JSON bytes, or None if there is no snapshot.
+        """
+        self.cursor.execute("SELECT body, checksum, created_at FROM Results_Snapshot")
+        result = self.cursor.fetchone()
+
+        if result:
+            return bytes(result[0]), result[1], result[2]
+        else:
+            return None
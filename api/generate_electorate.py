@@ -0,0 +1,219 @@
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from itertools import accumulate
+from argon2 import PasswordHasher, Type
+import database
+import hashing
+
+# Rows per executemany call; every table is still loaded inside one transaction
+BATCH_SIZE = 50000
+
+# Base 32 digits in ASCII order, so generated UVCs sort in the order they are inserted
+UVC_DIGITS = "23456789ABCDEFGHJKLMNPQRSTUVWXYZ"
+
+# Secondary indexes dropped for the load and rebuilt once at the end, which is much faster than maintaining them row by row
+LOAD_DROPPED_INDEXES = ("Voter_constituency_id", "Voter_selected_candidate_id")
+
+def uvc(number):
+    """
+    The number'th generated UVC, "S" followed by seven base 32 digits.
+    """
+
+    digits = []
+    for _ in range(7):
+        number, digit = divmod(number, 32)
+        digits.append(UVC_DIGITS[digit])
+    return "S" + "".join(reversed(digits))
+
+def voter_email(number):
+    return f"voter{number:09d}@electorate.test"
+
+def candidate_weights(candidates, distribution, skew):
+    """
+    Relative share of the vote for each candidate rank.
+    "uniform" gives everyone the same chance, "zipf" gives rank r a share of 1 / r ** skew.
+    """
+
+    if distribution == "zipf":
+        return [1 / rank ** skew for rank in range(1, candidates + 1)]
+    return [1] * candidates
+
+def _reset_reference_data(cursor, constituencies, candidates, parties):
+    """
+    Replace the seeded constituencies and candidates with generated ones.
+    Returns the candidate ids standing in each constituency, keyed by constituency id.
+    """
+
+    cursor.execute("DELETE FROM Candidate")
+    cursor.execute("DELETE FROM Constituency")
+    cursor.execute("DELETE FROM sqlite_sequence WHERE name = 'Candidate'")
+    cursor.executemany("INSERT INTO Constituency (constituency_id, constituency_name) VALUES (?, ?)",
+                       [(number, f"Constituency-{number:05d}") for number in range(1, constituencies + 1)])
+
+    cursor.execute("SELECT COUNT(*) FROM Party")
+    existing = cursor.fetchone()[0]
+    cursor.executemany("INSERT INTO Party (party) VALUES (?)", [(f"Party {number}",) for number in range(existing + 1, parties + 1)])
+    cursor.execute("SELECT party_id FROM Party ORDER BY party_id LIMIT ?", (parties,))
+    party_ids = [party[0] for party in cursor.fetchall()]
+
+    cursor.executemany("INSERT INTO Candidate (candidate, party_id, constituency_id, vote_count) VALUES (?, ?, ?, 0)", [
+        (f"Candidate {constituency}-{number + 1}", party_ids[(constituency + number) % len(party_ids)], constituency)
+        for constituency in range(1, constituencies + 1) for number in range(candidates)
+    ])
+
+    cursor.execute("SELECT canid, constituency_id FROM Candidate ORDER BY canid")
+    candidate_ids = {}
+    for canid, constituency_id in cursor.fetchall():
+        candidate_ids.setdefault(constituency_id, []).append(canid)
+    return candidate_ids
+
+def _voter_rows(voters, candidates, candidate_ids, password, turnout, distribution, skew, rng):
+    """
+    Yield (voter_id, full_name, DOB, password, UVC, constituency_id, selected_candidate_id) for every voter,
+    in voter_id order so the primary key index is appended to rather than split.
+    Each constituency ranks its candidates in its own random order, so seats spread across parties.
+    """
+
+    constituencies = len(candidate_ids)
+    cum_weights = list(accumulate(candidate_weights(candidates, distribution, skew)))
+    ranked = {constituency_id: rng.sample(canids, len(canids)) for constituency_id, canids in candidate_ids.items()}
+
+    for start in range(0, voters, BATCH_SIZE):
+        count = min(BATCH_SIZE, voters - start)
+        ranks = rng.choices(range(len(cum_weights)), cum_weights=cum_weights, k=count)
+        for offset in range(count):
+            number = start + offset
+            constituency_id = number % constituencies + 1
+            voted = rng.random() < turnout
+            yield (
+                voter_email(number), f"Voter {number}", "1990-01-01", password, uvc(number), constituency_id,
+                ranked[constituency_id][ranks[offset]] if voted else None
+            )
+
+def _batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def generate(database_file, constituencies, candidates, voters, parties=4, spare_uvcs=0, turnout=0.0,
+             distribution="uniform", skew=1.0, password="password", cheap_hash=True, status=None, seed=0, log=print):
+    """
+    Build a fresh database with the given electorate, every voter registered with the same password
+    and, with a turnout above 0, votes cast according to the distribution.
+    Bulk loads run with the journal off in large transactions, then the indexes, materialised results
+    and query planner statistics are rebuilt so the database is as consistent as one built by hand.
+    """
+
+    started = time.perf_counter()
+    rng = random.Random(seed)
+
+    # Hash once and share it, every voter logs in with the same password
+    if cheap_hash:
+        hashed_password = PasswordHasher(time_cost=1, memory_cost=1024, parallelism=1, type=Type.ID).hash(password)
+    else:
+        hashed_password = hashing.hash_password(password)
+
+    # Votes go straight into Voter, so the generated database never uses shards
+    with database.Database(database_file, shard_directory=None) as db:
+        db.migrate()
+    database.close_pools()
+
+    connection = sqlite3.connect(database_file, isolation_level=None)
+    try:
+        cursor = connection.cursor()
+        cursor.execute("PRAGMA journal_mode=OFF")
+        cursor.execute("PRAGMA synchronous=OFF")
+        cursor.execute("PRAGMA locking_mode=EXCLUSIVE")
+        cursor.execute(f"PRAGMA cache_size=-{database.CACHE_SIZE_KIB * 16}")
+
+        cursor.execute("BEGIN")
+        candidate_ids = _reset_reference_data(cursor, constituencies, candidates, parties)
+        for index in LOAD_DROPPED_INDEXES:
+            cursor.execute(f"DROP INDEX IF EXISTS {index}")
+        cursor.execute("COMMIT")
+        log(f"Created {constituencies} constituencies with {candidates} candidates each")
+
+        cursor.execute("BEGIN")
+        loaded = 0
+        for batch in _batches(_voter_rows(voters, candidates, candidate_ids, hashed_password, turnout, distribution, skew, rng)):
+            cursor.executemany("""
+                INSERT INTO Voter (voter_id, full_name, DOB, password, UVC, constituency_id, selected_candidate_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, batch)
+            cursor.executemany("INSERT INTO UVC_Code (UVC, used) VALUES (?, 1)", [(row[4],) for row in batch])
+            loaded += len(batch)
+            if loaded % (BATCH_SIZE * 20) == 0:
+                log(f"Loaded {loaded} voters ({time.perf_counter() - started:.0f}s)")
+
+        cursor.executemany("INSERT INTO UVC_Code (UVC, used) VALUES (?, 0)", ((uvc(number),) for number in range(voters, voters + spare_uvcs)))
+        cursor.execute("COMMIT")
+        log(f"Loaded {voters} voters and {voters + spare_uvcs} UVCs ({time.perf_counter() - started:.0f}s)")
+
+        cursor.execute("BEGIN")
+        for index, column in zip(LOAD_DROPPED_INDEXES, ("constituency_id", "selected_candidate_id")):
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {index} ON Voter ({column})")
+        cursor.execute("COMMIT")
+        log(f"Rebuilt indexes ({time.perf_counter() - started:.0f}s)")
+
+        # Leaving exclusive mode only takes effect on the next read, which must run to completion to let go of the lock
+        cursor.execute("ANALYZE")
+        cursor.execute("PRAGMA locking_mode=NORMAL")
+        cursor.execute("SELECT COUNT(*) FROM Election").fetchall()
+        cursor.execute("PRAGMA journal_mode=WAL").fetchall()
+        cursor.close()
+    finally:
+        connection.close()
+
+    # Tallies, constituency leaders, party seats, the results version and Reference_Version all follow from the rows above
+    with database.Database(database_file, shard_directory=None) as db:
+        if not db.rebuild_results():
+            raise RuntimeError("Rebuilding results failed")
+        # Set through Database so concluding freezes the results snapshot
+        if status and not db.update_election_status(status):
+            raise RuntimeError("Setting the election status failed")
+        problems = db.check_results()
+    database.close_pools()
+
+    if problems:
+        raise RuntimeError("Generated database is inconsistent: " + "; ".join(problems[:5]))
+    log(f"Done in {time.perf_counter() - started:.0f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a database with a synthetic electorate for scale testing.")
+    parser.add_argument("database", help="database file to create")
+    parser.add_argument("--constituencies", type=int, default=650)
+    parser.add_argument("--candidates", type=int, default=5, help="candidates per constituency")
+    parser.add_argument("--parties", type=int, default=4, help="parties candidates are drawn from, extra ones are added after the seeded four")
+    parser.add_argument("--voters", type=int, default=1000000, help="registered voters, spread evenly across constituencies")
+    parser.add_argument("--spare-uvcs", type=int, default=0, help="unused UVCs to add for registration tests")
+    parser.add_argument("--turnout", type=float, default=0.0, help="fraction of voters who have already voted")
+    parser.add_argument("--distribution", choices=["uniform", "zipf"], default="uniform", help="how votes spread over each constituency's candidates")
+    parser.add_argument("--skew", type=float, default=1.0, help="zipf exponent, higher concentrates votes on fewer candidates")
+    parser.add_argument("--password", default="password", help="password every generated voter logs in with")
+    parser.add_argument("--full-cost-hash", action="store_true", help="hash the password with the configured argon2 cost instead of a cheap one")
+    parser.add_argument("--status", choices=["NOTOPEN", "ONGOING", "CONCLUDED"], help="election status to set")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--force", action="store_true", help="replace the database file if it exists")
+    args = parser.parse_args()
+
+    if os.path.exists(args.database):
+        if not args.force:
+            sys.exit(f"{args.database} already exists, pass --force to replace it")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.database + suffix):
+                os.remove(args.database + suffix)
+
+    generate(args.database, args.constituencies, args.candidates, args.voters, args.parties, args.spare_uvcs, args.turnout,
+             args.distribution, args.skew, args.password, not args.full_cost_hash, args.status, args.seed)
+
+if __name__ == "__main__":
+    main()
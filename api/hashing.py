@@ -0,0 +1,136 @@
+import atexit
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from argon2 import PasswordHasher, Type
+from argon2.exceptions import VerificationError, InvalidHashError
+
+# Argon2 cost parameters, changing any of these rehashes each account's password on its next login.
+TIME_COST = int(os.environ.get("GEVS_ARGON2_TIME_COST", 3))
+MEMORY_COST = int(os.environ.get("GEVS_ARGON2_MEMORY_COST", 65536))
+PARALLELISM = int(os.environ.get("GEVS_ARGON2_PARALLELISM", 4))
+
+# Worker processes for hashing (0 hashes on the calling thread) and how many jobs may wait per worker.
+WORKERS = int(os.environ.get("GEVS_HASH_WORKERS", os.cpu_count() or 1))
+QUEUE_DEPTH_PER_WORKER = int(os.environ.get("GEVS_HASH_QUEUE_DEPTH", 4))
+TIMEOUT = float(os.environ.get("GEVS_HASH_TIMEOUT", 30))
+# Worker processes kept apart for bulk imports, so a long import never queues ahead of logins (0 hashes on the calling thread).
+BULK_WORKERS = int(os.environ.get("GEVS_BULK_HASH_WORKERS", max(1, WORKERS // 2)))
+
+class HashingBusy(Exception):
+    """
+    Raised when the hashing pool is saturated, or a job did not finish within TIMEOUT, and a request should be turned away.
+    """
+
+def _hasher():
+    return PasswordHasher(time_cost=TIME_COST, memory_cost=MEMORY_COST, parallelism=PARALLELISM, type=Type.ID)
+
+def _hash(password):
+    return _hasher().hash(password)
+
+def _hash_or_none(password):
+    # argon2 raises AttributeError, TypeError or HashingError depending on what is wrong with the password
+    try:
+        return _hash(password)
+    except Exception:
+        return None
+
+def _verify(saved_hash, password):
+    """
+    Verify password against saved_hash, runs inside a worker.
+    Returns a tuple of (verified, new_hash), where new_hash is set if the hash used outdated parameters.
+    """
+
+    hasher = _hasher()
+    try:
+        hasher.verify(saved_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False, None
+
+    if hasher.check_needs_rehash(saved_hash.decode() if isinstance(saved_hash, bytes) else saved_hash):
+        return True, hasher.hash(password)
+    return True, None
+
+_executor = None
+_bulk_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(max(WORKERS, 1) * QUEUE_DEPTH_PER_WORKER)
+
+def _get_executor():
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=WORKERS)
+        return _executor
+
+def _get_bulk_executor():
+    global _bulk_executor
+
+    with _executor_lock:
+        if _bulk_executor is None:
+            _bulk_executor = ProcessPoolExecutor(max_workers=BULK_WORKERS)
+        return _bulk_executor
+
+def _run(function, *args):
+    """
+    Run function in the worker pool, refusing immediately if too many jobs are already waiting.
+    A job still unfinished after TIMEOUT is abandoned and reported as busy too.
+    """
+
+    if WORKERS == 0:
+        return function(*args)
+
+    if not _slots.acquire(blocking=False):
+        raise HashingBusy()
+
+    try:
+        future = _get_executor().submit(function, *args)
+        try:
+            return future.result(timeout=TIMEOUT)
+        except TimeoutError:
+            future.cancel()
+            raise HashingBusy() from None
+    finally:
+        _slots.release()
+
+def hash_password(password):
+    """
+    Hash a password with the configured parameters.
+    Raises HashingBusy if the pool is saturated.
+    """
+
+    return _run(_hash, password)
+
+def hash_passwords(passwords):
+    """
+    Hash a batch of passwords across the bulk workers, used by bulk imports.
+    Returns the hashes in the same order, None for any password that could not be hashed so the rest of the batch still is.
+    Batches wait their turn rather than being turned away, on their own pool so interactive hashing never queues behind them.
+    """
+
+    if WORKERS == 0 or BULK_WORKERS == 0:
+        return [_hash_or_none(password) for password in passwords]
+
+    chunksize = max(1, len(passwords) // (BULK_WORKERS * 4))
+    return list(_get_bulk_executor().map(_hash_or_none, passwords, chunksize=chunksize))
+
+def verify_password(saved_hash, password):
+    """
+    Check a password against its saved hash.
+    Returns a tuple of (verified, new_hash), new_hash should replace the saved hash when it is not None.
+    Raises HashingBusy if the pool is saturated.
+    """
+
+    return _run(_verify, saved_hash, password)
+
+@atexit.register
+def shutdown():
+    global _executor, _bulk_executor
+
+    with _executor_lock:
+        for executor in (_executor, _bulk_executor):
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        _executor = None
+        _bulk_executor = None
@@ -0,0 +1,206 @@
+import functools
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+import database
+
+# Latency bucket upper bounds in seconds, from a cached read up to a saturated argon2 queue
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Database methods left out of instrumentation, close only hands the connection back to the pool
+# and iter_ballots returns a generator, whose work happens after the call has returned
+UNINSTRUMENTED = {"close", "iter_ballots"}
+
+class Histogram:
+    """
+    Cumulative latency histogram for one label set, plus the count and sum Prometheus expects.
+    """
+
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+class Registry:
+    """
+    Counters and histograms keyed by metric name and a tuple of label values.
+    One lock guards every update; each is a handful of integer additions, so contention stays low.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            histogram = self._histograms.get((name, labels))
+            if histogram is None:
+                histogram = self._histograms[(name, labels)] = Histogram()
+            histogram.observe(value)
+
+    def increment(self, name, labels, amount=1):
+        with self._lock:
+            self._counters[(name, labels)] = self._counters.get((name, labels), 0) + amount
+
+    def snapshot(self):
+        """
+        Return copies of the histograms and counters, taken under the lock so each is consistent.
+        """
+
+        with self._lock:
+            histograms = {key: (list(histogram.counts), histogram.count, histogram.sum) for key, histogram in self._histograms.items()}
+            return histograms, dict(self._counters)
+
+registry = Registry()
+
+# name: (type, help, label names)
+METRICS = {
+    "gevs_http_request_duration_seconds": ("histogram", "Time taken to produce a response, up to the first byte for streams.", ("route", "method")),
+    "gevs_http_requests_total": ("counter", "Requests answered, by status code.", ("route", "method", "status")),
+    "gevs_http_request_errors_total": ("counter", "Requests answered with a 5xx status.", ("route", "method")),
+    "gevs_db_query_duration_seconds": ("histogram", "Time spent in each Database method.", ("method",)),
+    "gevs_db_query_errors_total": ("counter", "Database method calls that raised.", ("method",)),
+    "gevs_db_query_lock_errors_total": ("counter", "Database method calls that gave up waiting on a SQLite lock.", ("method",)),
+    "gevs_db_rows_returned_total": ("counter", "Rows returned by each Database method.", ("method",))
+}
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _rows(result):
+    # Lists and dictionaries hold one entry per row, a tuple is a single row; anything else is a flag or count
+    if isinstance(result, (list, dict)):
+        return len(result)
+    return 1 if isinstance(result, tuple) else 0
+
+def instrument(cls):
+    """
+    Wrap every public method of cls so each call records its latency, rows returned and errors.
+    Safe to call more than once; methods already wrapped are left alone.
+    """
+
+    for name, method in list(vars(cls).items()):
+        if name.startswith("_") or name in UNINSTRUMENTED or not callable(method) or getattr(method, "instrumented", False):
+            continue
+        setattr(cls, name, _instrumented(name, method))
+    return cls
+
+def _instrumented(name, method):
+    labels = (name,)
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        except Exception as e:
+            registry.increment("gevs_db_query_errors_total", labels)
+            if isinstance(e, sqlite3.OperationalError) and "locked" in str(e):
+                registry.increment("gevs_db_query_lock_errors_total", labels)
+            raise
+        finally:
+            registry.observe("gevs_db_query_duration_seconds", labels, time.perf_counter() - started)
+
+        registry.increment("gevs_db_rows_returned_total", labels, _rows(result))
+        return result
+
+    wrapper.instrumented = True
+    return wrapper
+
+def record_request(route, method, status, seconds):
+    registry.observe("gevs_http_request_duration_seconds", (route, method), seconds)
+    registry.increment("gevs_http_requests_total", (route, method, str(status)))
+    if status >= 500:
+        registry.increment("gevs_http_request_errors_total", (route, method))
+
+def render(results_cache=None, admission_control=None):
+    """
+    Return every metric in the Prometheus text exposition format.
+    """
+
+    histograms, counters = registry.snapshot()
+    lines = []
+
+    for name, (metric_type, help_text, label_names) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+        if metric_type == "histogram":
+            for (metric, labels), (counts, count, total) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(LATENCY_BUCKETS, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(label_names, labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(label_names, labels, [('le', '+Inf')])} {count}")
+                lines.append(f"{name}_sum{_format_labels(label_names, labels)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(label_names, labels)} {count}")
+        else:
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(label_names, labels)} {value}")
+
+    # Errors the database layer logs and swallows rather than raising
+    lines.append("# HELP gevs_db_handled_errors_total Errors caught and logged by the database layer.")
+    lines.append("# TYPE gevs_db_handled_errors_total counter")
+    for operation, count in sorted(database.error_stats().items()):
+        lines.append(f"gevs_db_handled_errors_total{_format_labels(('operation',), (operation,))} {count}")
+
+    pools = database.pool_stats()
+    for name, key, metric_type, help_text in (
+        ("gevs_db_pool_connections_open", "opened", "gauge", "Connections the pool has open."),
+        ("gevs_db_pool_connections_idle", "idle", "gauge", "Open connections waiting to be handed out."),
+        ("gevs_db_pool_waits_total", "waits", "counter", "Times a caller had to wait for a connection to be released."),
+        ("gevs_db_pool_wait_seconds_total", "wait_seconds", "counter", "Total time callers spent waiting for a connection."),
+        ("gevs_db_pool_timeouts_total", "timeouts", "counter", "Times a caller gave up waiting for a connection.")
+    ):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for database_file, stats in sorted(pools.items()):
+            lines.append(f"{name}{_format_labels(('database',), (database_file,))} {_format_value(stats[key])}")
+
+    if results_cache is not None:
+        stats = results_cache.stats()
+        for key in ("hits", "misses", "evictions"):
+            lines.append(f"# HELP gevs_results_cache_{key}_total Results cache {key}.")
+            lines.append(f"# TYPE gevs_results_cache_{key}_total counter")
+            lines.append(f"gevs_results_cache_{key}_total {stats[key]}")
+        lines.append("# HELP gevs_results_cache_size Rendered results responses held in the cache.")
+        lines.append("# TYPE gevs_results_cache_size gauge")
+        lines.append(f"gevs_results_cache_size {stats['size']}")
+
+    if admission_control is not None:
+        stats = admission_control.stats()
+        lines.append("# HELP gevs_admission_rejected_total Requests turned away before any expensive work, by reason.")
+        lines.append("# TYPE gevs_admission_rejected_total counter")
+        for (route, reason), count in sorted(stats["rejected"].items()):
+            lines.append(f"gevs_admission_rejected_total{_format_labels(('route', 'reason'), (route, reason))} {count}")
+        for key, help_text in (
+            ("in_progress", "Password hashes and verifications in progress."),
+            ("accounts", "Accounts with a login rate bucket."),
+            ("clients", "Client addresses with a rate bucket.")
+        ):
+            lines.append(f"# HELP gevs_admission_{key} {help_text}")
+            lines.append(f"# TYPE gevs_admission_{key} gauge")
+            lines.append(f"gevs_admission_{key} {stats[key]}")
+
+    return "\n".join(lines) + "\n"
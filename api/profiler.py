@@ -0,0 +1,205 @@
+import io
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+# How often the sampler looks at request threads, and the longest a profiling window may run
+SAMPLE_INTERVAL = float(os.environ.get("GEVS_PROFILE_INTERVAL", 0.005))
+MAX_SECONDS = float(os.environ.get("GEVS_PROFILE_MAX_SECONDS", 300))
+MAX_STACK_DEPTH = 128
+
+class _SampledStats:
+    """
+    Adapter handing a ready-made stats dictionary to pstats.Stats.
+    """
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+class SamplingProfiler:
+    """
+    Statistical profiler for request threads, started on demand for a bounded window.
+    A background thread reads the stack of every thread currently serving a sampled request,
+    so requests themselves pay only for a dictionary update on the way in and out.
+    Samples are grouped by route and kept until the next window starts.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self.interval = SAMPLE_INTERVAL
+        self.sample_rate = 1.0
+        self.started_at = None
+        self.ends_at = 0.0
+
+    @property
+    def active(self):
+        return self._thread is not None and time.time() < self.ends_at
+
+    def start(self, seconds, sample_rate=1.0, interval=SAMPLE_INTERVAL):
+        """
+        Discard any previous samples and profile for the given number of seconds, capped at MAX_SECONDS.
+        Only sample_rate of the requests arriving in the window are sampled.
+        """
+
+        self.stop()
+        with self._lock:
+            self._samples.clear()
+            self._routes.clear()
+            self.interval = max(interval, 0.001)
+            self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+            self.started_at = time.time()
+            self.ends_at = self.started_at + min(seconds, MAX_SECONDS)
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="gevs-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        thread = self._thread
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+    def picks(self):
+        """
+        Return True if a window is open and a request arriving now should be sampled.
+        """
+
+        return self.active and (self.sample_rate >= 1 or random.random() < self.sample_rate)
+
+    def enter(self, route):
+        """
+        Mark the calling thread as serving route, if a window is open and this request is picked.
+        """
+
+        if self.picks():
+            self.attach(route)
+
+    def attach(self, route):
+        """
+        Mark the calling thread as serving route for a request already picked, e.g. a worker thread doing part of it.
+        """
+
+        self._routes[threading.get_ident()] = route
+
+    def exit(self):
+        self._routes.pop(threading.get_ident(), None)
+
+    def _run(self):
+        own_ident = threading.get_ident()
+
+        while not self._stop.wait(self.interval) and time.time() < self.ends_at:
+            frames = sys._current_frames()
+            for ident, route in list(self._routes.items()):
+                frame = frames.get(ident)
+                if frame is None or ident == own_ident:
+                    continue
+
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                    frame = frame.f_back
+                stack.reverse()
+
+                with self._lock:
+                    self._samples[(route, tuple(stack))] += 1
+
+        with self._lock:
+            self.ends_at = min(self.ends_at, time.time())
+            self._routes.clear()
+            self._thread = None
+
+    def _stacks(self, route=None):
+        with self._lock:
+            return [(sample_route, stack, count) for (sample_route, stack), count in self._samples.items() if route is None or sample_route == route]
+
+    def status(self):
+        """
+        Return whether a window is open, its settings and the number of samples taken per route.
+        """
+
+        by_route = Counter()
+        for route, _, count in self._stacks():
+            by_route[route] += count
+
+        return {
+            "active": self.active,
+            "started_at": self.started_at,
+            "ends_at": self.ends_at if self.started_at else None,
+            "interval": self.interval,
+            "sample_rate": self.sample_rate,
+            "samples": dict(by_route)
+        }
+
+    def collapsed(self, route=None):
+        """
+        Return the samples in collapsed stack format, one "route;outer;...;inner count" line per stack,
+        ready for flamegraph.pl or speedscope.
+        """
+
+        lines = Counter()
+        for sample_route, stack, count in self._stacks(route):
+            frames = (f"{name} ({os.path.basename(filename)}:{line})" for filename, line, name in stack)
+            lines[";".join([sample_route, *frames])] += count
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(lines.items()))
+
+    def stats(self, route=None):
+        """
+        Return the samples as a pstats dictionary. Times are samples multiplied by the interval
+        and call counts are sample counts, so ratios between functions are what matter.
+        """
+
+        stats = {}
+        for _, stack, count in self._stacks(route):
+            elapsed = count * self.interval
+            seen = set()
+            for depth, function in enumerate(stack):
+                cc, nc, tt, ct, callers = stats.get(function, (0, 0, 0.0, 0.0, {}))
+                if depth == len(stack) - 1:
+                    tt += elapsed
+                # Recursive functions count once per sample towards their cumulative time
+                if function not in seen:
+                    seen.add(function)
+                    cc += count
+                    nc += count
+                    ct += elapsed
+                if depth:
+                    caller = stack[depth - 1]
+                    edge = callers.get(caller, (0, 0, 0.0, 0.0))
+                    callers[caller] = (edge[0] + count, edge[1] + count, edge[2] + (elapsed if depth == len(stack) - 1 else 0.0), edge[3] + elapsed)
+                stats[function] = (cc, nc, tt, ct, callers)
+        return stats
+
+    def pstats_dump(self, route=None):
+        """
+        Return the samples as a marshalled pstats file, loadable with "python -m pstats" or snakeviz.
+        """
+
+        return marshal.dumps(self.stats(route))
+
+    def pstats_text(self, route=None, sort="cumulative", limit=40):
+        """
+        Return the samples as a pstats report, the busiest limit functions first.
+        """
+
+        stats = self.stats(route)
+        if not stats:
+            return "No samples collected\n"
+
+        output = io.StringIO()
+        pstats.Stats(_SampledStats(stats), stream=output).sort_stats(sort).print_stats(limit)
+        return output.getvalue()
+
+profiler = SamplingProfiler()
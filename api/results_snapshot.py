@@ -0,0 +1,54 @@
+import argparse
+import hashlib
+import os
+import sys
+import database
+
+def verify(body, checksum):
+    """
+    Check snapshot bytes against the SHA-256 checksum stored with them.
+    """
+
+    return hashlib.sha256(body).hexdigest() == checksum
+
+def export_snapshot(output, database_file=database.DATABASE_FILE):
+    """
+    Write the frozen results to output, plus output.sha256 in sha256sum format so the file can be checked once published.
+    Returns the checksum, or None if the election has not concluded.
+    Raises ValueError if the stored snapshot no longer matches its checksum.
+    """
+
+    with database.Database(database_file) as db:
+        snapshot = db.get_results_snapshot()
+
+    if snapshot is None:
+        return None
+
+    body, checksum, _ = snapshot
+    if not verify(body, checksum):
+        raise ValueError("Results snapshot does not match its checksum")
+
+    with open(output, "wb") as file:
+        file.write(body)
+    with open(output + ".sha256", "w") as file:
+        file.write(f"{checksum}  {os.path.basename(output)}\n")
+
+    return checksum
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the results frozen when the election concluded, for publication.")
+    parser.add_argument("output", help="file to write the results JSON to, its checksum goes next to it with a .sha256 suffix")
+    parser.add_argument("--database", default=database.DATABASE_FILE, help="database file to export from")
+    args = parser.parse_args()
+
+    try:
+        checksum = export_snapshot(args.output, args.database)
+    except ValueError as e:
+        sys.exit(f"Error during results export: {e}")
+
+    if checksum is None:
+        sys.exit("The election has not concluded, there is no results snapshot to export")
+    print(f"Wrote {args.output} (sha256 {checksum})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import asyncio
+import json
+import os
+import queue
+import threading
+import database
+
+# How often the publisher looks for new votes; bursts inside one interval go out as a single push.
+COALESCE_INTERVAL = float(os.environ.get("GEVS_SSE_COALESCE_INTERVAL", 0.5))
+SUBSCRIBER_QUEUE_SIZE = 64
+
+class Subscriber:
+    """
+    One open event stream. constituency_name is None for a subscriber following every constituency.
+    """
+
+    def __init__(self, constituency_name=None):
+        self.constituency_name = constituency_name
+        self.events = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.closed = False
+
+    def send(self, event):
+        """
+        Queue an event, returning False if the subscriber has fallen too far behind to keep.
+        """
+
+        try:
+            self.events.put_nowait(event)
+            return True
+        except queue.Full:
+            return False
+
+    def close(self):
+        self.closed = True
+        try:
+            self.events.put_nowait(None)
+        except queue.Full:
+            pass
+
+class AsyncSubscriber(Subscriber):
+    """
+    Subscriber read from an asyncio event loop, so an open stream costs a queue rather than a thread.
+    The publisher thread hands events over to the loop thread-safely.
+    """
+
+    def __init__(self, loop, constituency_name=None):
+        super().__init__(constituency_name)
+        self.loop = loop
+        self.events = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def _put(self, event):
+        try:
+            self.events.put_nowait(event)
+        except asyncio.QueueFull:
+            pass
+
+    def send(self, event):
+        # qsize is only approximate off the loop thread, which is fine for spotting a stalled client
+        if self.events.qsize() >= SUBSCRIBER_QUEUE_SIZE - 1:
+            return False
+
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+            return True
+        except RuntimeError:
+            return False
+
+    def close(self):
+        self.closed = True
+        try:
+            self.loop.call_soon_threadsafe(self._put, None)
+        except RuntimeError:
+            pass
+
+class TallyPublisher:
+    """
+    Shared fan-out publisher for live constituency tallies.
+    A single background thread watches the results version, loads every tally with one query
+    when it changes and pushes only the candidates whose counts moved to each interested subscriber.
+    """
+
+    def __init__(self, database_file=database.DATABASE_FILE, interval=COALESCE_INTERVAL):
+        self.database_file = database_file
+        self.interval = interval
+        self.queries = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._version = None
+        self._tallies = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _load(self):
+        with database.Database(self.database_file) as db:
+            version, _ = db.get_results_version()
+            rows = db.get_all_tallies()
+
+        self.queries += 1
+        return version, {row["candidate_id"]: row for row in rows}
+
+    @staticmethod
+    def _format(rows, constituency_name=None):
+        constituencies = {}
+        for row in rows:
+            if constituency_name is None or row["constituency"] == constituency_name:
+                constituencies.setdefault(row["constituency"], []).append({
+                    "candidate_id": row["candidate_id"],
+                    "candidate": row["candidate"],
+                    "party": row["party"],
+                    "vote_count": row["vote_count"]
+                })
+
+        return constituencies
+
+    @staticmethod
+    def _event(name, version, constituencies):
+        return f"event: {name}\nid: {version}\ndata: {json.dumps({'version': version, 'constituencies': constituencies})}\n\n"
+
+    def has_constituency(self, constituency_name):
+        """
+        Check the name against the Constituency table, so constituencies with no candidates yet can still be followed.
+        """
+
+        with database.Database(self.database_file) as db:
+            return any(constituency["constituency_name"] == constituency_name for constituency in db.get_constituencies())
+
+    def _ensure_loaded(self):
+        if self._version is None:
+            self._version, self._tallies = self._load()
+
+    def subscribe(self, constituency_name=None, subscriber=None):
+        """
+        Register a new subscriber (or the one given) and queue a full snapshot of the tallies it follows.
+        """
+
+        if subscriber is None:
+            subscriber = Subscriber(constituency_name)
+        constituency_name = subscriber.constituency_name
+
+        with self._lock:
+            self._ensure_loaded()
+            snapshot = self._format(self._tallies.values(), constituency_name)
+            subscriber.send(self._event("snapshot", self._version, snapshot))
+            self._subscribers.add(subscriber)
+
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="gevs-tally-publisher", daemon=True)
+                self._thread.start()
+
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+        subscriber.close()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                if not self._subscribers:
+                    # Nobody listening, let the thread end; the next subscribe starts it again
+                    self._thread = None
+                    return
+
+            try:
+                self.publish()
+            except Exception as e:
+                print(f"Error during tally publishing: {e}")
+
+    def publish(self):
+        """
+        Push any tally changes since the last check to every subscriber they concern.
+        """
+
+        with database.Database(self.database_file) as db:
+            version, _ = db.get_results_version()
+
+        with self._lock:
+            if version == self._version:
+                return
+
+        version, tallies = self._load()
+
+        with self._lock:
+            changed = [row for candidate_id, row in tallies.items() if self._tallies.get(candidate_id) != row]
+            self._version = version
+            self._tallies = tallies
+
+            if not changed:
+                return
+
+            # Format each constituency's delta once, however many subscribers follow it
+            events = {}
+            for subscriber in list(self._subscribers):
+                name = subscriber.constituency_name
+                if name not in events:
+                    delta = self._format(changed, name)
+                    events[name] = self._event("delta", version, delta) if delta else None
+
+                if events[name] and not subscriber.send(events[name]):
+                    # Too slow to keep up, drop it so the client reconnects and gets a fresh snapshot
+                    self._subscribers.discard(subscriber)
+                    subscriber.close()
+
+    def stop(self):
+        self._stop.set()
+        with self._lock:
+            for subscriber in self._subscribers:
+                subscriber.close()
+            self._subscribers.clear()
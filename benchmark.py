@@ -0,0 +1,342 @@
+import argparse
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import argon2
+import requests
+from api import database
+
+# Reproducible load test of the voting lifecycle, or with --micro a benchmark of Database methods without HTTP.
+# Each run is saved as JSON tagged with the commit, and --compare prints the change against an earlier run.
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(ROOT, "api")
+COMMISSIONER = ("election@shangrila.gov.sr", "shangrila2024$")
+PASSWORD = "benchmark-password"
+
+# Cheap argon2 settings for --cheap-hash runs, which measure everything except hashing cost
+CHEAP_HASH_ENV = {"GEVS_ARGON2_TIME_COST": "1", "GEVS_ARGON2_MEMORY_COST": "1024", "GEVS_ARGON2_PARALLELISM": "1"}
+
+class Recorder:
+    """
+    Collects the latency and outcome of every call, grouped by endpoint.
+    """
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def time(self, endpoint, function, *args):
+        start = time.perf_counter()
+        try:
+            ok = function(*args)
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append((elapsed, bool(ok)))
+        return ok
+
+def _percentile(ordered, fraction):
+    # Nearest rank, so the figure is always a latency that was actually observed
+    return ordered[max(0, min(len(ordered) - 1, int(round(fraction * len(ordered))) - 1))]
+
+def summarise(recorder, wall_time):
+    """
+    Turn recorded samples into throughput and latency percentiles (in milliseconds) per endpoint.
+    """
+
+    summary = {}
+    for endpoint, samples in recorder.samples.items():
+        latencies = sorted(sample[0] for sample in samples)
+        summary[endpoint] = {
+            "requests": len(samples),
+            "errors": sum(1 for sample in samples if not sample[1]),
+            "throughput": round(len(samples) / wall_time, 2) if wall_time else None,
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+            "p50_ms": round(_percentile(latencies, 0.50) * 1000, 3),
+            "p95_ms": round(_percentile(latencies, 0.95) * 1000, 3),
+            "p99_ms": round(_percentile(latencies, 0.99) * 1000, 3)
+        }
+    return summary
+
+def run_phase(name, tasks, concurrency, results):
+    """
+    Run every task (a function taking a Recorder) at the given concurrency and store its summary under name.
+    """
+
+    recorder = Recorder()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(task, recorder) for task in tasks]:
+            future.result()
+    wall_time = time.perf_counter() - start
+
+    results[name] = {"wall_time_s": round(wall_time, 3), "endpoints": summarise(recorder, wall_time)}
+    print(f"{name}: {len(tasks)} tasks in {wall_time:.2f}s")
+
+def prepare_database(database_file, voters, constituencies, candidates):
+    """
+    Build a fresh database with the given number of constituencies and candidates per constituency,
+    and one UVC per synthetic voter.
+    Returns a tuple of (UVCs, constituency names, candidate ids per constituency id).
+    """
+
+    uvcs = [f"B{number:07d}" for number in range(voters)]
+    uvc_file = database_file + ".uvcs"
+    with open(uvc_file, "w") as file:
+        file.write("\n".join(uvcs) + "\n")
+
+    with database.Database(database_file) as db:
+        db.migrate()
+        db.load_uvc_codes(uvc_file)
+
+        db.cursor.execute("SELECT COUNT(*) FROM Constituency")
+        existing = db.cursor.fetchone()[0]
+        db.cursor.executemany("INSERT INTO Constituency (constituency_name) VALUES (?)", [(f"Benchmark-{number}",) for number in range(existing, constituencies)])
+
+        db.cursor.execute("DELETE FROM Candidate")
+        db.cursor.execute("SELECT party_id FROM Party")
+        parties = [party[0] for party in db.cursor.fetchall()]
+        db.cursor.executemany("""
+            INSERT INTO Candidate (candidate, party_id, constituency_id, vote_count) VALUES (?, ?, ?, 0)
+        """, [(f"Candidate {constituency}-{number}", parties[number % len(parties)], constituency)
+              for constituency in range(1, constituencies + 1) for number in range(candidates)])
+
+        db.cursor.connection.commit()
+        db.rebuild_results()
+
+        db.cursor.execute("SELECT constituency_name FROM Constituency ORDER BY constituency_id")
+        names = [constituency[0] for constituency in db.cursor.fetchall()]
+
+        db.cursor.execute("SELECT canid, constituency_id FROM Candidate ORDER BY canid")
+        candidate_ids = {}
+        for canid, constituency_id in db.cursor.fetchall():
+            candidate_ids.setdefault(constituency_id, []).append(canid)
+
+    return uvcs, names, candidate_ids
+
+def wait_for(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+def start_apps(args, database_file):
+    env = dict(os.environ, GEVS_DATABASE=database_file, GEVS_DEBUG="0",
+               GEVS_API_PORT=str(args.api_port), GEVS_FRONTEND_PORT=str(args.frontend_port),
+               GEVS_API_BASE_URL=f"http://127.0.0.1:{args.api_port}/gevs", GEVS_API_BACKEND=args.backend)
+    # Every simulated voter connects from this machine, so the per-address rate limit would throttle the whole run
+    env.setdefault("GEVS_ADMISSION_CLIENT_RATE", "0")
+    if args.cheap_hash:
+        env.update(CHEAP_HASH_ENV)
+
+    processes = [
+        subprocess.Popen([sys.executable, "api.py"], cwd=API_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL),
+        subprocess.Popen([sys.executable, "frontend.py"], cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    ]
+
+    try:
+        wait_for(f"http://127.0.0.1:{args.api_port}/gevs/results")
+        wait_for(f"http://127.0.0.1:{args.frontend_port}/login")
+    except RuntimeError:
+        stop_apps(processes)
+        raise
+    return processes
+
+def stop_apps(processes):
+    # SIGINT lets each app run its atexit hooks, so the hashing pool and its workers go down with it
+    for process in processes:
+        process.send_signal(signal.SIGINT)
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+def run_lifecycle(args, results):
+    """
+    Drive both apps through a registration wave, a login storm, a vote surge and results polling.
+    """
+
+    workdir = tempfile.mkdtemp(prefix="gevs-benchmark-")
+    database_file = os.path.join(workdir, "database.db")
+    uvcs, names, candidate_ids = prepare_database(database_file, args.voters, args.constituencies, args.candidates)
+    processes = start_apps(args, database_file)
+
+    api_url = f"http://127.0.0.1:{args.api_port}/gevs"
+    frontend_url = f"http://127.0.0.1:{args.frontend_port}"
+    voters = [(f"voter{number}@benchmark.test", uvc, number % args.constituencies + 1) for number, uvc in enumerate(uvcs)]
+    sessions = {email: requests.Session() for email, _, _ in voters}
+
+    try:
+        def register(email, uvc, constituency_id):
+            def task(recorder):
+                recorder.time("POST /register", lambda: sessions[email].post(f"{frontend_url}/register", data={
+                    "email": email, "password": PASSWORD, "full_name": "Benchmark Voter", "dob": "2000-01-01",
+                    "uvc": uvc, "constituency_id": constituency_id
+                }, allow_redirects=False).status_code == 302)
+            return task
+
+        def login(email):
+            def task(recorder):
+                recorder.time("POST /login", lambda: sessions[email].post(f"{frontend_url}/login", data={
+                    "email": email, "password": PASSWORD
+                }, allow_redirects=False).status_code == 302)
+            return task
+
+        def vote(number, email, constituency_id):
+            def task(recorder):
+                recorder.time("GET /voter_dashboard", lambda: sessions[email].get(f"{frontend_url}/voter_dashboard").ok)
+                candidates = candidate_ids[constituency_id]
+                candidate_id = candidates[number % len(candidates)]
+                recorder.time("POST /voter_dashboard", lambda: b"submitted and" in sessions[email].post(f"{frontend_url}/voter_dashboard", data={
+                    "candidate": candidate_id
+                }).content)
+            return task
+
+        def poll(number):
+            def task(recorder):
+                name = names[number % len(names)]
+                recorder.time("GET /gevs/constituency/<name>", lambda: requests.get(f"{api_url}/constituency/{name}").ok)
+                recorder.time("GET /gevs/results", lambda: requests.get(f"{api_url}/results").ok)
+            return task
+
+        run_phase("registration_wave", [register(*voter) for voter in voters], args.concurrency, results)
+        run_phase("login_storm", [login(email) for email, _, _ in voters], args.concurrency, results)
+
+        commissioner = requests.Session()
+        commissioner.post(f"{frontend_url}/login", data={"email": COMMISSIONER[0], "password": COMMISSIONER[1]})
+        commissioner.post(f"{frontend_url}/commissioner_dashboard", data={"new_status": "ONGOING"})
+
+        run_phase("vote_surge", [vote(number, email, constituency_id) for number, (email, _, constituency_id) in enumerate(voters)], args.concurrency, results)
+        run_phase("results_polling", [poll(number) for number in range(args.polls)], args.concurrency, results)
+
+    finally:
+        stop_apps(processes)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def run_micro(args, results):
+    """
+    Time Database methods directly against a temporary database, without HTTP or the web apps.
+    """
+
+    workdir = tempfile.mkdtemp(prefix="gevs-benchmark-")
+    database_file = os.path.join(workdir, "database.db")
+    uvcs, names, candidate_ids = prepare_database(database_file, args.voters, args.constituencies, args.candidates)
+
+    # Votes only count while the election is ongoing
+    with database.Database(database_file) as db:
+        db.update_election_status("ONGOING")
+
+    # One real hash shared by every voter, so this measures the database rather than argon2
+    hashed_password = argon2.PasswordHasher().hash(PASSWORD)
+    voters = [(f"voter{number}@benchmark.test", uvc, number % args.constituencies + 1) for number, uvc in enumerate(uvcs)]
+
+    def call(name, method, *method_args):
+        def task(recorder):
+            def invoke():
+                with database.Database(database_file) as db:
+                    result = getattr(db, method)(*method_args)
+                return result is not None and result is not False
+            recorder.time(name, invoke)
+        return task
+
+    try:
+        # Checked while every UVC is still unused, afterwards the in-memory index answers without touching the database
+        run_phase("micro_uvc", [call("is_uvc_valid", "is_uvc_valid", uvc) for uvc in uvcs], args.concurrency, results)
+        run_phase("micro_register", [call("register_voter", "register_voter", email, "Benchmark Voter", "2000-01-01", hashed_password, uvc, constituency_id)
+                                     for email, uvc, constituency_id in voters], args.concurrency, results)
+        run_phase("micro_reads", [task for email, _, constituency_id in voters for task in (
+            call("get_account", "get_account", email),
+            call("get_constituency_candidates", "get_constituency_candidates", constituency_id),
+            call("get_election_status", "get_election_status"),
+            call("get_voter_context", "get_voter_context", email)
+        )], args.concurrency, results)
+        run_phase("micro_vote", [call("cast_vote", "cast_vote", email, candidate_ids[constituency_id][0])
+                                 for email, _, constituency_id in voters], args.concurrency, results)
+        run_phase("micro_results", [task for number in range(args.polls) for task in (
+            call("get_constituency_results", "get_constituency_results", names[number % len(names)]),
+            call("get_seats_by_party", "get_seats_by_party"),
+            call("get_results_version", "get_results_version")
+        )], args.concurrency, results)
+
+    finally:
+        database.close_pools()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_report(phases, baseline=None):
+    for phase, result in phases.items():
+        print(f"\n{phase} ({result['wall_time_s']}s)")
+        for endpoint, stats in result["endpoints"].items():
+            line = f"  {endpoint:32} {stats['requests']:>7} req {stats['errors']:>5} err {stats['throughput']:>9} req/s  p50 {stats['p50_ms']:>8}ms  p95 {stats['p95_ms']:>8}ms  p99 {stats['p99_ms']:>8}ms"
+
+            before = (baseline or {}).get(phase, {}).get("endpoints", {}).get(endpoint)
+            if before and before["p95_ms"]:
+                line += f"  (p95 {100 * (stats['p95_ms'] - before['p95_ms']) / before['p95_ms']:+.1f}%)"
+            print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the GEVS voting lifecycle.")
+    parser.add_argument("--voters", type=int, default=200, help="synthetic voters (and UVCs) to generate")
+    parser.add_argument("--constituencies", type=int, default=5, help="constituencies to spread voters across")
+    parser.add_argument("--candidates", type=int, default=3, help="candidates per constituency")
+    parser.add_argument("--polls", type=int, default=500, help="results polls in the polling phase")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--micro", action="store_true", help="benchmark Database methods directly instead of over HTTP")
+    parser.add_argument("--backend", choices=["http", "inprocess"], default="http", help="how the frontend reaches the API")
+    parser.add_argument("--cheap-hash", action="store_true", help="use minimal argon2 costs so hashing does not dominate")
+    parser.add_argument("--api-port", type=int, default=5101)
+    parser.add_argument("--frontend-port", type=int, default=5100)
+    parser.add_argument("--output", help="where to save the JSON results, defaults to benchmark-<commit>.json")
+    parser.add_argument("--compare", help="earlier JSON results to compare p95 latencies against")
+    args = parser.parse_args()
+
+    phases = {}
+    if args.micro:
+        run_micro(args, phases)
+    else:
+        run_lifecycle(args, phases)
+
+    commit = current_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "mode": "micro" if args.micro else "lifecycle",
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "phases": phases
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)["phases"]
+    print_report(phases, baseline)
+
+    output = args.output or f"benchmark-{commit or 'unknown'}.json"
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"\nSaved results to {output}")
+
+if __name__ == "__main__":
+    main()
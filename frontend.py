@@ -1,14 +1,17 @@
 from flask import Flask, render_template, request, redirect, url_for, session
 from api import database
+import json
+import os
 import secrets
-import requests
+import api_client
 from flask_cors import CORS
 
 app = Flask(__name__)
 CORS(app)
 app.secret_key = secrets.token_hex(16)
 
-API_BASE_URL = "http://localhost:5001/gevs"
+# Talks to the GEVS API over HTTP or in-process, see GEVS_API_BACKEND
+client = api_client.get_client()
 
 @app.before_request
 def before_request():
@@ -25,18 +28,20 @@ def login():
         email = request.form["email"]
         password = request.form["password"]
 
-        api_url = f"{API_BASE_URL}/login"
-        payload = {"email": email, "password": password}
-        response = requests.post(api_url, json=payload)
+        response, status = client.login(email, password, request.remote_addr)
 
-        if response.json().get("status") == "success":
+        if response.get("status") == "success":
             session["email"] = email
-            if response.json().get("account") == "voter":
+            if response.get("account") == "voter":
                 return redirect(url_for("voter_dashboard"))
-            elif response.json().get("account") == "commissioner":
+            elif response.get("account") == "commissioner":
                 return redirect(url_for("commissioner_dashboard"))
         else:
-            error_message = "Invalid email or password. Please try again."
+            # Tell throttled or shed users to wait rather than that their password is wrong
+            if status in (429, 503):
+                error_message = response.get("message", "Server busy, please try again")
+            else:
+                error_message = "Invalid email or password. Please try again."
             return render_template("login.html", error_message=error_message)
 
     elif request.method == "GET":
@@ -52,7 +57,6 @@ def register():
         uvc = request.form["uvc"]
         constituency_id = request.form["constituency_id"]
 
-        api_url = f"{API_BASE_URL}/register"
         payload = {
             "email": email,
             "password": password,
@@ -62,17 +66,17 @@ def register():
             "constituency_id": constituency_id
         }
 
-        response = requests.post(api_url, json=payload)
+        response, _ = client.register(payload, request.remote_addr)
 
-        if response.json().get("status") == "success":
+        if response.get("status") == "success":
             session["email"] = email
             return redirect(url_for("login"))
         else:
-            error_message = response.json().get("message", "Registration failed. Please try again.")
+            error_message = response.get("message", "Registration failed. Please try again.")
             return render_template("register.html", error_message=error_message)
 
     elif request.method == "GET":
-        with database.Database(database_file="api/database.db") as db:
+        with database.Database() as db:
             constituencies = db.get_constituencies()
 
         return render_template("register.html", constituencies=constituencies)
@@ -80,45 +84,52 @@ def register():
 @app.route("/voter_dashboard", methods=["GET", "POST"])
 def voter_dashboard():
     email = session.get("email")
-    with database.Database(database_file="api/database.db") as db:
-        election_status = db.get_election_status()
-        constituency_candidates = db.get_all_candidates()
-        has_voted = db.has_voter_voted(email)
-        voter_constituency = db.get_voter_constituency(email)
-
-    if election_status == "NOTOPEN":
+    # One connection and at most one query, the context is usually served from the per-voter cache
+    with database.Database() as db:
+        context = db.get_voter_context(email)
+        voted = None
+        if request.method == "POST" and context and context.status == "ONGOING" and not context.has_voted:
+            voted = db.cast_vote(email, request.form.get("candidate"))
+
+    if context is None:
+        return redirect(url_for("login"))
+    elif context.status == "NOTOPEN":
         return render_template("thanks.html", message="The election is not yet open. Come back when it is.")
-    elif election_status == "CONCLUDED":
+    elif context.status == "CONCLUDED":
         return render_template("thanks.html", message="The election has concluded.")
-    elif has_voted and election_status == "ONGOING":
+    elif context.has_voted and context.status == "ONGOING":
         return render_template("thanks.html", message="Your vote has been submitted and the election is ongoing.")
     elif request.method == "POST":
-        candidate_id = request.form.get("candidate")
-        with database.Database(database_file="api/database.db") as db:
-            if db.cast_vote(email, candidate_id):
-                return render_template("thanks.html", message="Your vote has been submitted and the election is ongoing.")
+        if voted:
+            return render_template("thanks.html", message="Your vote has been submitted and the election is ongoing.")
+        else:
+            return render_template("thanks.html", message="Your vote could not be submitted. You may have already voted.")
     else:
-        return render_template("voter_dashboard.html", email=email, constituency_candidates=constituency_candidates, voter_constituency=voter_constituency)
+        return render_template("voter_dashboard.html", email=email, constituency_candidates=context.candidates)
 
 @app.route("/commissioner_dashboard", methods=["GET", "POST"])
 def commissioner_dashboard():
     email = session.get("email")
     if request.method == "POST":
         new_status = request.form.get("new_status")
-        with database.Database(database_file="api/database.db") as db:
+        with database.Database() as db:
             db.update_election_status(new_status)
 
-    with database.Database(database_file="api/database.db") as db:
+    with database.Database() as db:
         election_status = db.get_election_status()
         constituencies = db.get_constituencies()
         print(election_status)
 
+        # The results are frozen once the election concludes, so read the snapshot rather than asking the API
         election_results = None
         if election_status == "CONCLUDED":
-            response = requests.get(f"{API_BASE_URL}/results")
-            election_results = response.json()
+            snapshot = db.get_results_snapshot()
+            if snapshot:
+                election_results = json.loads(snapshot[0])
+            else:
+                election_results, _ = client.results()
 
     return render_template("commissioner_dashboard.html", email=email, election_status=election_status, election_results=election_results, constituencies=constituencies)
 
 if __name__ == "__main__":
-    app.run(debug=True, port=5000)
+    app.run(debug=os.environ.get("GEVS_DEBUG", "1") == "1", port=int(os.environ.get("GEVS_FRONTEND_PORT", 5000)))
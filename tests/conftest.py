@@ -0,0 +1,48 @@
+import os
+import sys
+import pytest
+
+# The API modules import each other as siblings, the way api.py runs them
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api"))
+
+# Hash on the calling thread with cheap parameters, tests check behaviour rather than cost
+os.environ.setdefault("GEVS_HASH_WORKERS", "0")
+os.environ.setdefault("GEVS_ARGON2_TIME_COST", "1")
+os.environ.setdefault("GEVS_ARGON2_MEMORY_COST", "8")
+os.environ.setdefault("GEVS_ARGON2_PARALLELISM", "1")
+
+import database
+
+@pytest.fixture
+def database_file(tmp_path):
+    """
+    A freshly migrated database with the seeded constituencies, parties, candidate and commissioner.
+    """
+
+    database_file = str(tmp_path / "database.db")
+    with database.Database(database_file, shard_directory=None) as db:
+        db.migrate()
+
+    yield database_file
+    database.close_pools()
+
+@pytest.fixture
+def db(database_file):
+    with database.Database(database_file, shard_directory=None) as db:
+        yield db
+
+def add_candidate(db, name, party_id, constituency_id):
+    db.cursor.execute("INSERT INTO Candidate (candidate, party_id, constituency_id, vote_count) VALUES (?, ?, ?, 0)", (name, party_id, constituency_id))
+    db.cursor.connection.commit()
+    return db.cursor.lastrowid
+
+def add_voter(db, email, constituency_id):
+    db.cursor.execute("""
+        INSERT INTO Voter (voter_id, full_name, DOB, password, UVC, constituency_id)
+        VALUES (?, 'Test Voter', '2000-01-01', 'unused', ?, ?)
+    """, (email, f"UVC-{email}", constituency_id))
+    db.cursor.connection.commit()
+
+def add_uvcs(db, *uvcs):
+    db.cursor.executemany("INSERT INTO UVC_Code (UVC, used) VALUES (?, 0)", [(uvc,) for uvc in uvcs])
+    db.cursor.connection.commit()
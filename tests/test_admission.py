@@ -0,0 +1,52 @@
+import pytest
+
+import admission
+
+def test_an_account_is_limited_across_every_address():
+    control = admission.AdmissionControl()
+    control.clients = admission.TokenBuckets(0, 0)
+    control.accounts = admission.TokenBuckets(0.001, 3)
+
+    for number in range(3):
+        control.admit("login", f"10.0.0.{number}", account="voter@example.com")
+
+    with pytest.raises(admission.Shed) as shed:
+        control.admit("login", "10.0.0.99", account="voter@example.com")
+    assert shed.value.status == 429
+    assert shed.value.retry_after >= 1
+
+    # Other accounts are unaffected
+    control.admit("login", "10.0.0.99", account="other@example.com")
+    assert control.stats()["rejected"] == {("login", "account_rate"): 1}
+
+def test_a_client_is_limited_across_every_account():
+    control = admission.AdmissionControl()
+    control.clients = admission.TokenBuckets(0.001, 2)
+
+    control.admit("login", "10.0.0.1", account="a@example.com")
+    control.admit("register", "10.0.0.1")
+    with pytest.raises(admission.Shed):
+        control.admit("login", "10.0.0.1", account="b@example.com")
+
+    control.admit("login", "10.0.0.2", account="b@example.com")
+    assert control.stats()["rejected"] == {("login", "client_rate"): 1}
+
+def test_expensive_work_beyond_the_limit_is_shed_with_a_503():
+    control = admission.AdmissionControl()
+    control.expensive_limit = 1
+
+    with control.expensive("login"):
+        with pytest.raises(admission.Shed) as shed:
+            with control.expensive("register"):
+                pass
+        assert shed.value.status == 503
+
+    # The slot is handed back once the work finishes
+    with control.expensive("login"):
+        assert control.stats()["in_progress"] == 1
+    assert control.stats()["in_progress"] == 0
+
+def test_forwarded_addresses_are_only_trusted_from_a_proxy():
+    assert admission.client_address("127.0.0.1", "203.0.113.5, 198.51.100.7") == "198.51.100.7"
+    assert admission.client_address("203.0.113.9", "198.51.100.7") == "203.0.113.9"
+    assert admission.client_address("127.0.0.1", None) == "127.0.0.1"
@@ -0,0 +1,41 @@
+import io
+import pytest
+
+import audit_export
+from conftest import add_candidate, add_voter
+
+@pytest.fixture
+def voted(db):
+    other = add_candidate(db, "Candidate 2", 1, 1)
+    for number in range(5):
+        add_voter(db, f"voter{number}@example.com", 1)
+    db.update_election_status("ONGOING")
+    for number in range(3):
+        assert db.cast_vote(f"voter{number}@example.com", 1 if number else other)
+    return other
+
+def export(database_file, file_format, pii="hash"):
+    # A small batch size makes the export read the ballots in several steps
+    records = audit_export.export_records(database_file, pii, batch_size=2)
+    return b"".join(audit_export.render(records, file_format))
+
+@pytest.mark.parametrize("file_format", audit_export.FORMATS)
+def test_an_export_reads_back_and_verifies(database_file, voted, file_format):
+    ballots, counted, tallies = audit_export.read_counts(io.BytesIO(export(database_file, file_format)), file_format)
+
+    assert ballots == 5
+    assert counted == {1: 2, voted: 1}
+    assert tallies == {1: 2, voted: 1}
+    assert audit_export.verify(io.BytesIO(export(database_file, file_format)), file_format) == (5, [])
+
+@pytest.mark.parametrize("file_format", ("csv", "jsonl"))
+def test_an_export_leaves_out_voter_emails(database_file, voted, file_format):
+    for pii in ("hash", "strip"):
+        assert b"@example.com" not in export(database_file, file_format, pii)
+
+def test_a_changed_tally_fails_verification(database_file, voted):
+    data = export(database_file, "jsonl").replace(b'"vote_count": 2', b'"vote_count": 3')
+
+    ballots, problems = audit_export.verify(io.BytesIO(data), "jsonl")
+    assert ballots == 5
+    assert problems == ["Candidate 1 has a tally of 3 but 2 ballots"]
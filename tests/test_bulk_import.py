@@ -0,0 +1,56 @@
+import bulk_import
+from conftest import add_uvcs
+
+def voter(number, **fields):
+    return dict({
+        "email": f"voter{number}@example.com",
+        "password": "password",
+        "full_name": "Test Voter",
+        "dob": "2000-01-01",
+        "uvc": f"UVC{number}",
+        "constituency_id": 1
+    }, **fields)
+
+def test_rows_of_the_wrong_type_are_reported_and_the_rest_imported(db, database_file):
+    add_uvcs(db, *(f"UVC{number}" for number in range(6)))
+    rows = [
+        voter(0),
+        voter(1, email=["voter1@example.com"]),
+        voter(2, uvc={"code": "UVC2"}),
+        voter(3, password=12345),
+        voter(4, constituency_id="1"),
+        voter(5, constituency_id=True)
+    ]
+
+    report = list(bulk_import.import_voters(rows, database_file, chunk_size=10))
+
+    assert [(entry["row"], entry["error"]) for entry in report[:-1]] == [
+        (2, "Invalid email"),
+        (3, "Invalid uvc"),
+        (4, "Invalid password"),
+        (6, "Invalid constituency_id")
+    ]
+    assert report[-1] == {"imported": 2, "failed": 4}
+    assert db.get_registered_emails([row["email"] for row in rows if isinstance(row["email"], str)]) == {"voter0@example.com", "voter4@example.com"}
+
+def test_a_password_that_cannot_be_hashed_fails_only_its_row(db, database_file, monkeypatch):
+    add_uvcs(db, "UVC0", "UVC1", "UVC2")
+    real_hash = bulk_import.hashing._hash
+
+    def hash_password(password):
+        if password == "unhashable":
+            raise ValueError(password)
+        return real_hash(password)
+
+    monkeypatch.setattr(bulk_import.hashing, "_hash", hash_password)
+    report = list(bulk_import.import_voters([voter(0), voter(1, password="unhashable"), voter(2)], database_file))
+
+    assert report == [{"row": 2, "email": "voter1@example.com", "error": "Invalid password"}, {"imported": 2, "failed": 1}]
+
+def test_jsonl_lines_that_are_not_objects_are_reported():
+    rows = list(bulk_import.read_rows(['{"email": "a@example.com"}\n', "[1, 2]\n", "not json\n", "\n"], "jsonl"))
+
+    assert rows[0] == {"email": "a@example.com"}
+    assert rows[1] == {"_error": "Row is not an object"}
+    assert rows[2]["_error"].startswith("Invalid JSON")
+    assert len(rows) == 3
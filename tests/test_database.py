@@ -0,0 +1,76 @@
+import sqlite3
+import pytest
+
+from conftest import add_candidate, add_voter
+
+def test_string_candidate_ids_update_the_constituency_leader(db):
+    # The voter dashboard posts candidate ids as form strings
+    runner_up = 1
+    leader = add_candidate(db, "Candidate 2", 1, 1)
+    for number in range(3):
+        add_voter(db, f"voter{number}@example.com", 1)
+    db.update_election_status("ONGOING")
+
+    assert db.cast_vote("voter0@example.com", str(runner_up))
+    assert db.cast_vote("voter1@example.com", str(leader))
+    assert db.cast_vote("voter2@example.com", str(leader))
+
+    db.cursor.execute("SELECT candidate_id, vote_count FROM Constituency_Result WHERE constituency_id = 1")
+    assert db.cursor.fetchone() == (leader, 2)
+    leader_party = next(candidate["party"] for candidate in db.get_all_candidates() if candidate["id"] == leader)
+    assert {seat["party"]: seat["seat"] for seat in db.get_seats_by_party()}[leader_party] == 1
+    assert db.check_results() == []
+
+def test_concluding_twice_keeps_the_snapshot(db):
+    add_voter(db, "voter@example.com", 1)
+    db.update_election_status("ONGOING")
+    assert db.cast_vote("voter@example.com", 1)
+
+    assert db.update_election_status("CONCLUDED")
+    body, checksum, created_at = db.get_results_snapshot()
+    assert db.update_election_status("CONCLUDED")
+    assert db.get_results_snapshot() == (body, checksum, created_at)
+
+    with pytest.raises(sqlite3.IntegrityError):
+        db.cursor.execute("DELETE FROM Results_Snapshot")
+    db.cursor.connection.rollback()
+
+def test_a_concluded_election_cannot_be_reopened(db):
+    add_voter(db, "voter@example.com", 1)
+    db.update_election_status("ONGOING")
+    assert db.update_election_status("CONCLUDED")
+    snapshot = db.get_results_snapshot()
+
+    assert not db.update_election_status("ONGOING")
+    assert not db.update_election_status("NOTOPEN")
+    assert db.get_election_status() == "CONCLUDED"
+    assert db.get_results_snapshot() == snapshot
+    assert not db.cast_vote("voter@example.com", 1)
+
+    with pytest.raises(sqlite3.IntegrityError):
+        db.cursor.execute("UPDATE Election SET status = 'ONGOING'")
+    db.cursor.connection.rollback()
+
+def test_votes_are_refused_unless_the_election_is_ongoing(db):
+    for number in range(2):
+        add_voter(db, f"voter{number}@example.com", 1)
+
+    db.update_election_status("NOTOPEN")
+    assert not db.cast_vote("voter0@example.com", 1)
+
+    db.update_election_status("CONCLUDED")
+    assert not db.cast_vote("voter1@example.com", 1)
+
+    db.cursor.execute("SELECT COUNT(*) FROM Voter WHERE selected_candidate_id IS NOT NULL")
+    assert db.cursor.fetchone()[0] == 0
+
+def test_codes_appended_to_a_loaded_uvc_file_are_picked_up(db, tmp_path):
+    uvc_file = tmp_path / "UVCs.txt"
+    uvc_file.write_text("AAAA1111\nBBBB2222\n")
+    assert db.load_uvc_codes(str(uvc_file)) == 2
+    assert db.load_uvc_codes(str(uvc_file)) == 0
+
+    with open(uvc_file, "a") as file:
+        file.write("CCCC3333\n")
+    assert db.load_uvc_codes(str(uvc_file)) == 1
+    assert db.is_uvc_valid("CCCC3333")
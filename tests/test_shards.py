@@ -0,0 +1,71 @@
+import json
+import threading
+import pytest
+
+import database
+from conftest import add_candidate, add_voter
+
+@pytest.fixture
+def shards(tmp_path, database_file):
+    shards = database.ShardSet(str(tmp_path / "shards"))
+    yield shards
+    shards.close()
+
+@pytest.fixture
+def sharded_db(database_file, shards, monkeypatch):
+    monkeypatch.setattr(database, "get_shard_set", lambda directory: shards)
+    with database.Database(database_file, shard_directory=shards.directory) as db:
+        yield db
+
+def test_a_ballot_is_only_recorded_while_open(shards):
+    assert not shards.cast_vote("voter0@example.com", 1, 1, is_open=lambda: False)
+    assert shards.cast_vote("voter0@example.com", 1, 1, is_open=lambda: True)
+    assert not shards.cast_vote("voter0@example.com", 1, 1, is_open=lambda: True)
+    assert shards.read([1])[1][2] == {1: 1}
+
+def test_a_vote_waiting_on_locked_shards_sees_the_status_set_meanwhile(shards):
+    state = {"open": True}
+    results = []
+    voter = threading.Thread(target=lambda: results.append(shards.cast_vote("voter0@example.com", 1, 1, is_open=lambda: state["open"])))
+
+    with shards.locked([1, 2]):
+        voter.start()
+        voter.join(0.2)
+        # The vote cannot take the shard's write lock until the block ends
+        assert voter.is_alive()
+        state["open"] = False
+
+    voter.join(5)
+    assert results == [False]
+    assert shards.read([1])[1][2] == {}
+
+def test_one_constituency_reads_only_its_own_shard(sharded_db, shards, monkeypatch):
+    read = []
+    real_read = shards.read
+
+    def recording_read(constituency_ids):
+        constituency_ids = list(constituency_ids)
+        read.extend(constituency_ids)
+        return real_read(constituency_ids)
+
+    monkeypatch.setattr(shards, "read", recording_read)
+
+    constituency = sharded_db.get_constituencies()[1]
+    sharded_db.get_constituency_results(constituency["constituency_name"])
+
+    assert read == [constituency["constituency_id"]]
+
+def test_concluding_freezes_the_shard_tallies(sharded_db):
+    other = add_candidate(sharded_db, "Candidate 2", 1, 1)
+    for number in range(3):
+        add_voter(sharded_db, f"voter{number}@example.com", 1)
+    sharded_db.update_election_status("ONGOING")
+
+    assert sharded_db.cast_vote("voter0@example.com", 1)
+    assert sharded_db.cast_vote("voter1@example.com", str(other))
+    assert sharded_db.update_election_status("CONCLUDED")
+    assert not sharded_db.cast_vote("voter2@example.com", 1)
+
+    constituency = json.loads(sharded_db.get_results_snapshot()[0])["constituencies"][0]["results"]
+    assert sorted(result["vote_count"] for result in constituency) == [1, 1]
+    assert sharded_db.check_results() == []
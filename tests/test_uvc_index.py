@@ -0,0 +1,44 @@
+import sqlite3
+import pytest
+
+import database
+
+@pytest.fixture
+def cursor():
+    connection = sqlite3.connect(":memory:")
+    connection.execute("CREATE TABLE UVC_Code (UVC TEXT PRIMARY KEY, used INTEGER)")
+    connection.executemany("INSERT INTO UVC_Code VALUES (?, ?)", [("AAAA1111", 0), ("BBBB2222", 1)])
+    yield connection.cursor()
+    connection.close()
+
+def test_unknown_and_used_codes_are_rejected(cursor):
+    index = database.UVCIndex()
+
+    assert index.might_be_unused(cursor, "AAAA1111")
+    assert not index.might_be_unused(cursor, "BBBB2222")
+    assert not index.might_be_unused(cursor, "FORGED00")
+    assert not index.might_be_unused(cursor, "FAR TOO LONG TO BE A CODE")
+
+    index.mark_used("AAAA1111")
+    assert not index.might_be_unused(cursor, "AAAA1111")
+
+def test_a_forged_code_costs_one_lookup_and_no_rebuild(cursor, monkeypatch):
+    index = database.UVCIndex()
+    index.might_be_unused(cursor, "AAAA1111")
+
+    monkeypatch.setattr(index, "refresh", lambda cursor: pytest.fail("index rebuilt"))
+    assert not index.might_be_unused(cursor, "FORGED00")
+
+def test_codes_loaded_elsewhere_are_found_on_a_miss(cursor):
+    index = database.UVCIndex()
+    assert not index.might_be_unused(cursor, "CCCC3333")
+
+    # Loaded by another process, nothing has told this index
+    cursor.execute("INSERT INTO UVC_Code VALUES ('CCCC3333', 0)")
+    assert index.might_be_unused(cursor, "CCCC3333")
+
+def test_codes_too_long_to_pack_switch_the_index_off(cursor):
+    cursor.execute("INSERT INTO UVC_Code VALUES ('A CODE LONGER THAN EIGHT BYTES', 0)")
+    index = database.UVCIndex()
+
+    assert index.might_be_unused(cursor, "FORGED00")
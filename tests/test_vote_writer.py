@@ -0,0 +1,68 @@
+import sqlite3
+import pytest
+
+import database
+from conftest import add_candidate, add_voter
+
+@pytest.fixture
+def writer(database_file):
+    writer = database.VoteWriter(database_file, max_batch=3, window=5)
+    yield writer
+    writer.close()
+
+def vote_counts(db):
+    db.cursor.execute("SELECT canid, vote_count FROM Candidate ORDER BY canid")
+    return dict(db.cursor.fetchall())
+
+def test_a_batch_applies_every_vote_once(db, writer):
+    other = add_candidate(db, "Candidate 2", 1, 1)
+    for number in range(2):
+        add_voter(db, f"voter{number}@example.com", 1)
+    db.update_election_status("ONGOING")
+
+    # max_batch votes close the batch straight away, so these three share one transaction
+    futures = [
+        writer.submit("voter0@example.com", 1),
+        writer.submit("voter1@example.com", other),
+        writer.submit("voter0@example.com", other)
+    ]
+
+    assert [future.result(timeout=5) for future in futures] == [True, True, False]
+    assert vote_counts(db) == {1: 1, other: 1}
+    assert db.check_results() == []
+
+def test_a_failing_vote_is_rolled_back_alone(db, writer):
+    for number in range(3):
+        add_voter(db, f"voter{number}@example.com", 1)
+    db.update_election_status("ONGOING")
+
+    # A candidate id SQLite cannot bind fails inside the vote's savepoint
+    futures = [
+        writer.submit("voter0@example.com", 1),
+        writer.submit("voter1@example.com", object()),
+        writer.submit("voter2@example.com", 1)
+    ]
+
+    assert [future.result(timeout=5) for future in futures] == [True, False, True]
+    assert vote_counts(db) == {1: 2}
+    assert db.check_results() == []
+
+def test_a_failing_batch_fails_its_votes_and_the_writer_carries_on(db, writer, monkeypatch):
+    for number in range(4):
+        add_voter(db, f"voter{number}@example.com", 1)
+    db.update_election_status("ONGOING")
+
+    broken = sqlite3.connect(":memory:")
+    broken.close()
+    connection = writer._connection
+    monkeypatch.setattr(writer, "_connection", broken)
+
+    futures = [writer.submit(f"voter{number}@example.com", 1) for number in range(3)]
+    for future in futures:
+        with pytest.raises(sqlite3.ProgrammingError):
+            future.result(timeout=5)
+
+    monkeypatch.setattr(writer, "_connection", connection)
+    writer.max_batch = 1
+    assert writer.submit("voter3@example.com", 1).result(timeout=5)
+    assert vote_counts(db) == {1: 1}